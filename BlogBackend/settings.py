@@ -9,6 +9,8 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from blog.logconfig import build_logging
+
 # Load variables from .env file
 load_dotenv()
 
@@ -50,39 +52,26 @@ INSTALLED_APPS = [
     'users',
 ]
 
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'handlers': {
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'debug.log'),  # output file path
-        },
-    },
-    'loggers': {
-        'django': {
-            'handlers': ['file'],
-            'level': 'DEBUG',
-            'propagate': True,
-        },
-        'boto3': {
-            'handlers': ['file'],
-            'level': 'DEBUG',
-            'propagate': False,
-        },
-        'botocore': {
-            'handlers': ['file'],
-            'level': 'DEBUG',
-            'propagate': False,
-        },
-        's3transfer': {
-            'handlers': ['file'],
-            'level': 'DEBUG',
-            'propagate': False,
-        },
-    },
-}
+# Queued logging (blog/logconfig.py). DJANGO_LOG_PROFILE picks the levels:
+# production, development or debug (botocore wire logs, rate-limited).
+# DJANGO_LOG_FILE is the file to write ('-' for stdout). Several gunicorn
+# workers write it, so by default it's rotated by logrotate, not by the
+# process; DJANGO_LOG_MAX_BYTES turns on in-process rotation for a single
+# process (runserver). Test runs log to a temp dir (blog/testrunner.py).
+LOG_PROFILE = os.getenv('DJANGO_LOG_PROFILE', 'production')
+LOGGING = build_logging(
+    os.getenv('DJANGO_LOG_FILE', BASE_DIR / 'debug.log'),
+    profile=LOG_PROFILE,
+    max_bytes=int(os.getenv('DJANGO_LOG_MAX_BYTES', 0)),
+    backup_count=5,
+)
+TEST_RUNNER = 'blog.testrunner.TestRunner'
+
+# Per-request timings (blog/instrumentation.py): Server-Timing header, and a
+# JSON log line for a sample of requests plus every slow one.
+PERF_SERVER_TIMING = True
+PERF_LOG_SAMPLE_RATE = 0.05
+PERF_SLOW_REQUEST_MS = 500
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -92,23 +81,35 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        "blog.auth.CookieJWTAuthentication",            # <- our fallback
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        "blog.auth.CookieJWTAuthentication",            # header, then cookie
     ],
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),      # default: 5 minutes
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),      # default: 1 day
-    "ROTATE_REFRESH_TOKENS": False,
-    "BLACKLIST_AFTER_ROTATION": False,
+    # each refresh hands out a new refresh token and revokes the old one
+    # (blog.revocation, no blacklist app)
+    "ROTATE_REFRESH_TOKENS": True,
+    "BLACKLIST_AFTER_ROTATION": True,
 
     "ALGORITHM": "HS256",
     "SIGNING_KEY": SECRET_KEY,
     "AUTH_HEADER_TYPES": ("Bearer",),
+    # adds the claims blog.auth builds the request user from
+    "TOKEN_OBTAIN_SERIALIZER": "blog.auth.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "blog.auth.RotatingTokenRefreshSerializer",
 }
 
+# Revoked refresh tokens (blog/revocation.py): per-process Bloom filter sizing
+# and how often it catches up with revocations made by other processes.
+TOKEN_DENYLIST_CAPACITY = 100_000
+TOKEN_DENYLIST_ERROR_RATE = 0.001
+TOKEN_DENYLIST_SYNC_INTERVAL = 5
+TOKEN_DENYLIST_REBUILD_INTERVAL = 60 * 60
+
 MIDDLEWARE = [
+    'blog.instrumentation.instrumentation_middleware',  # first, so `total` covers the rest
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -117,6 +118,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.routers.replica_pin_middleware',
 ]
 
 ROOT_URLCONF = 'BlogBackend.urls'
@@ -142,13 +144,83 @@ WSGI_APPLICATION = 'BlogBackend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers keep going while a
+# comment is being written; NORMAL sync is safe under WAL (a power cut can
+# lose the last commits, never corrupt). cache_size is in KiB when negative.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # take the write lock at BEGIN so concurrent writers wait on
+            # busy_timeout instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # keep connections between requests (0 = close after each one)
+        'CONN_MAX_AGE': int(os.getenv('DJANGO_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (blog/routers.py). Safe-method requests on the post, comment,
+# tag and category views read from one of these; writes and everything else
+# use `default`. To try it locally, copy db.sqlite3 and point
+# DJANGO_REPLICA_DB at the copy.
+if os.getenv('DJANGO_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DJANGO_REPLICA_DB'),
+        'OPTIONS': {
+            **DATABASES['default']['OPTIONS'],
+            # nothing writes here, so don't take the write lock at BEGIN
+            'transaction_mode': 'DEFERRED',
+            # only has an effect on the shared-cache in-memory test database:
+            # the mirror reads the rows of the open test-case transaction
+            # instead of failing with "database table is locked"
+            'init_command': DATABASES['default']['OPTIONS']['init_command'] + ';PRAGMA read_uncommitted=1',
+        },
+        # tests read the test database through it, like a replica with no lag
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+# After a write the client reads from `default` for this long (replication lag).
+# Responses cached from replica reads expire after it too (blog/cache.py).
+REPLICA_PIN_COOKIE = 'db_pin'
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache (used by the read endpoint response cache in blog/cache.py).
+# locmem is per process; set DJANGO_CACHE_DIR to a shared directory to use the
+# file-based backend when running several gunicorn workers.
+if os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'blog-api',
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -228,6 +300,38 @@ AWS_DEFAULT_ACL = None
 AWS_QUERYSTRING_AUTH = False
 AWS_S3_FILE_OVERWRITE = False
 
+# Shared S3 client (blog/s3.py): one pool per process for the storages,
+# uploads, presigning and the health checks.
+AWS_S3_MAX_POOL_CONNECTIONS = 32
+AWS_S3_CONNECT_TIMEOUT = 5
+AWS_S3_READ_TIMEOUT = 30
+AWS_S3_MAX_ATTEMPTS = 5
+
+# URL / exists / size caches on MediaStorage (blog/mediacache.py)
+MEDIA_URL_CACHE_SIZE = 10_000
+MEDIA_URL_CACHE_TTL = 3600
+MEDIA_METADATA_CACHE_SIZE = 10_000
+MEDIA_METADATA_CACHE_TTL = 300
+
+# Max concurrent storage uploads per multi-image post (blog/uploads.py)
+IMAGE_UPLOAD_WORKERS = 4
+
+# Presigned direct-to-bucket uploads (/api/images/presign/ and /finalize/)
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_URL_EXPIRY = 60 * 10
+IMAGE_UPLOAD_CONTENT_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif']
+
+# Resized copies generated in the background for every uploaded image
+# (blog/derivatives.py). Formats Pillow can't encode here are skipped.
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1024, 1600]
+IMAGE_DERIVATIVE_FORMATS = ['avif', 'webp']
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVES_SYNC = False  # generate inline instead of on the worker thread
+
+# Threaded comments: levels of nesting allowed (top-level is depth 0).
+# /api/posts/<post_pk>/comments/?depth=N returns fewer.
+COMMENT_MAX_DEPTH = 6
+
 # 1. Static/Media URL
 STATIC_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/static/"
 MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/media/"
@@ -1,9 +1,13 @@
 from storages.backends.s3boto3 import S3Boto3Storage
 
-class StaticStorage(S3Boto3Storage):
+from blog.instrumentation import InstrumentedStorageMixin
+from blog.mediacache import CachedStorageMixin
+from blog.s3 import SharedClientStorageMixin
+
+class StaticStorage(InstrumentedStorageMixin, SharedClientStorageMixin, S3Boto3Storage):
     location = "static"
     default_acl = "public-read"
 
-class MediaStorage(S3Boto3Storage):
+class MediaStorage(CachedStorageMixin, InstrumentedStorageMixin, SharedClientStorageMixin, S3Boto3Storage):
     location = "media"
     default_acl = "public-read"
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Async versions of the public read endpoints, mounted under /api/async/.
+
+Under ASGI these run on the event loop: the ORM work is `aget` / `async for`
+(one hop to the DB thread per query batch) and serialization runs inline,
+since the querysets are planned so the serializers never touch the database.
+Authentication is the stateless token check from blog.auth, which needs no
+query either. Writes stay on the DRF views.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+
+from .auth import CookieJWTAuthentication
+from .filters import PostFilterBackend, visible_posts
+from .models import Category, Comment, Post, Tag
+from .pagination import AsyncKeysetPagination
+from .queries import plan_queryset
+from .serializers import CategorySerializer, CommentSerializer, PostListSerializer, PostSerializer, TagSerializer
+from .threads import build_tree, reply_depth
+
+
+def async_api_view(view):
+    """
+    Wrap the Django request in a DRF Request (query_params, token user) and
+    turn DRF exceptions into JSON error responses.
+    """
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request, authenticators=[CookieJWTAuthentication()])
+        try:
+            request.user  # authenticate up front so a bad token is a 401
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            # same body DRF's exception handler would send
+            data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            return JsonResponse(data, status=exc.status_code, safe=False)
+    return wrapper
+
+
+async def _is_staff(request):
+    """
+    From the token's is_staff claim. Tokens without it (RefreshToken.for_user,
+    or issued before the claims existed) load the user row, off the event loop.
+    """
+    if not request.user.is_authenticated:
+        return False
+    claim = request.auth.get('is_staff') if request.auth is not None else None
+    if claim is not None:
+        return bool(claim)
+    return await sync_to_async(lambda: request.user.is_staff)()
+
+
+@async_api_view
+async def post_list(request):
+    context = {'request': request}
+    queryset = visible_posts(Post.objects.all(), request.user).defer('markdown', 'rendered_html', 'toc')
+    queryset = PostFilterBackend().filter_queryset(request, queryset, None)
+    queryset = plan_queryset(queryset, PostListSerializer(context=context))
+
+    paginator = AsyncKeysetPagination(('-created_at', '-id'))
+    posts = await paginator.paginate_queryset(queryset, request)
+    return JsonResponse(paginator.get_paginated_data(PostListSerializer(posts, many=True, context=context).data))
+
+
+@async_api_view
+async def post_detail(request, pk):
+    context = {'request': request}
+    queryset = plan_queryset(visible_posts(Post.objects.all(), request.user), PostSerializer(context=context))
+    try:
+        post = await queryset.aget(pk=pk)
+    except Post.DoesNotExist:
+        raise NotFound('No Post matches the given query.')
+    return JsonResponse(PostSerializer(post, context=context).data)
+
+
+@async_api_view
+async def comment_list(request, post_pk):
+    """
+    Same tree as CommentViewSet.list: a page of top-level comments plus their
+    replies down to `?depth=`.
+    """
+    queryset = Comment.objects.filter(post_id=post_pk)
+    if not await _is_staff(request):
+        queryset = queryset.filter(approved=True)
+
+    paginator = AsyncKeysetPagination(('created_at', 'id'))
+    page = await paginator.paginate_queryset(queryset.filter(parent__isnull=True), request)
+    replies = []
+    depth = reply_depth(request)
+    if page and depth:
+        replies = [c async for c in queryset.filter(thread__in=[c.pk for c in page], depth__range=(1, depth)).order_by('path')]
+
+    comments = [*page, *replies]
+    data = build_tree(comments, CommentSerializer(comments, many=True, context={'request': request}).data)
+    return JsonResponse(paginator.get_paginated_data(data))
+
+
+@async_api_view
+async def category_list(request):
+    categories = [c async for c in Category.objects.all()]
+    return JsonResponse(CategorySerializer(categories, many=True, context={'request': request}).data, safe=False)
+
+
+@async_api_view
+async def tag_list(request):
+    tags = [t async for t in Tag.objects.all()]
+    return JsonResponse(TagSerializer(tags, many=True, context={'request': request}).data, safe=False)
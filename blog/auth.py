@@ -1,49 +1,142 @@
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DEFERRED
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .revocation import denylist
+
+
+# Copied from the user into every token (see set_user_claims), so most
+# requests never need the user row.
+USER_CLAIMS = ('username', 'is_staff', 'is_active')
+
+
+def set_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+
+
+class DenylistRefreshToken(RefreshToken):
+    """
+    Refresh token checked against blog.revocation instead of simplejwt's
+    blacklist app (which costs a query on every refresh).
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if denylist.is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is revoked')
+
+    def blacklist(self):
+        # TokenRefreshSerializer calls this on the old token when rotating
+        denylist.revoke(self[api_settings.JTI_CLAIM], datetime_from_epoch(self['exp']))
+
+    revoke = blacklist
+
+    def outstand(self):
+        # no outstanding-token table, only revoked jtis are stored
+        return None
+
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = DenylistRefreshToken
 
-# class CookieJWTAuthentication(JWTAuthentication):
-#     def authenticate(self, request):
-#         token = request.COOKIES.get('access_token')
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        set_user_claims(token, user)
+        return token
 
-#         if not token:
-#             return None  # No token = anonymous user
 
-#         try:
-#             validated_token = self.get_validated_token(token)
-#             return self.get_user(validated_token), validated_token
-#         except AuthenticationFailed:
-#             return None
-        
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    simplejwt's refresh, except the claims on the new tokens come from the
+    user row, not the old token: a demoted user loses is_staff at the next
+    refresh, and tokens issued without the claims get them.
+    """
+    token_class = DenylistRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = None
+        if user_id is not None:
+            user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        # before access_token, which copies the refresh token's claims
+        set_user_claims(refresh, user)
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
+
+
+def token_user(validated_token):
+    """
+    A real user instance built from the token's claims without a query.
+    Fields the token doesn't carry are deferred, so Django loads them from
+    the database only if something actually reads them (e.g. `/api/me/`
+    reading `email`).
+    """
+    User = get_user_model()
+    try:
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+
+    pk_field = User._meta.get_field(api_settings.USER_ID_FIELD)
+    known = {pk_field.attname: pk_field.to_python(user_id)}
+    known.update({claim: validated_token[claim] for claim in USER_CLAIMS if claim in validated_token})
+
+    fields = [field.attname for field in User._meta.concrete_fields]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [known.get(name, DEFERRED) for name in fields])
+
 
 ### NEW HTTP-ONLY COOKIE AUTH ###
 class CookieJWTAuthentication(JWTAuthentication):
     """
     Authenticate using Authorization header first; if missing, fall back to 'access_token' cookie.
+    The token is decoded once and the user comes from its claims (see token_user).
     """
     def authenticate(self, request):
-        """
-        Try Authorization header first; if missing/invalid, fall back to 'access_token' cookie.
-        """
-        def authenticate(self, request):
-            # 1) Try header
-            header = self.get_header(request)
-            if header:
-                try:
-                    return super().authenticate(request)
-                except AuthenticationFailed:
-                    # fall through to cookie
-                    pass
-
-        # Fallback to cookie
-        raw_token = request.COOKIES.get('access_token')
-        if not raw_token:
+        header = self.get_header(request)
+        raw_header_token = self.get_raw_token(header) if header else None
+        raw_cookie_token = request.COOKIES.get('access_token')
+
+        if raw_header_token is not None:
+            try:
+                validated = self.get_validated_token(raw_header_token)
+                return (self.get_user(validated), validated)
+            except AuthenticationFailed:
+                if not raw_cookie_token:
+                    raise
+                # fall through to cookie
+
+        if not raw_cookie_token:
             return None
 
         try:
-            validated = self.get_validated_token(raw_token)
+            validated = self.get_validated_token(raw_cookie_token)
         except InvalidToken as e:
             raise AuthenticationFailed("Invalid token in cookie") from e
 
-        return (self.get_user(validated), validated)
\ No newline at end of file
+        return (self.get_user(validated), validated)
+
+    def get_user(self, validated_token):
+        return token_user(validated_token)
@@ -0,0 +1,102 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .routers import reading_from_replica
+
+VERSION_PREFIX = 'rcache:v:'
+ENTRY_PREFIX = 'rcache:e:'
+
+
+def _version_keys(tags):
+    return [VERSION_PREFIX + tag for tag in tags]
+
+
+def tag_versions(tags):
+    """
+    Current version token of every tag. A tag with no token yet (or one the
+    backend evicted) gets a fresh random one, never an old value, so entries
+    stored under an earlier token can't come back to life.
+    """
+    keys = _version_keys(tags)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    """
+    Bump the tags' versions; every cached response carrying one of them now
+    misses. Works across processes with any shared backend (file, redis...).
+
+    Inside a transaction the bump waits for the commit: until then readers
+    still see the old rows, and one of them would cache those under the new
+    version.
+    """
+    keys = _version_keys(tags)
+    transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None))
+
+
+def request_audience(request):
+    # Authors see their own drafts, so authenticated entries are per user.
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return 'anon'
+
+
+def response_cache_key(request, view_name, tags):
+    query = sorted(request.query_params.lists())
+    audience = request_audience(request)
+    raw = '|'.join([
+        request.build_absolute_uri(request.path),
+        repr(query),
+        audience,
+        request.accepted_media_type or '',
+        *tag_versions(tags),
+    ])
+    return f'{ENTRY_PREFIX}{view_name}:{hashlib.sha256(raw.encode()).hexdigest()}'
+
+
+class CachedResponseMixin:
+    """
+    Caches list/retrieve responses. Entries are keyed on URL, query params,
+    the audience (anonymous or the user) and the versions of `get_cache_tags()`;
+    blog.signals bumps those versions on writes.
+    """
+    cache_timeout = None
+
+    def get_cache_tags(self):
+        raise NotImplementedError
+
+    def _cached(self, handler, request, *args, **kwargs):
+        key = response_cache_key(request, type(self).__name__, self.get_cache_tags())
+        hit = cache.get(key)
+        if hit is not None:
+            data, status = hit
+            response = Response(data, status=status)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout if self.cache_timeout is not None else settings.RESPONSE_CACHE_TIMEOUT
+            if reading_from_replica():
+                # the replica may not have the write behind the version we
+                # store this under yet; keep it no longer than the lag
+                timeout = min(timeout, settings.REPLICA_PIN_SECONDS)
+            cache.set(key, (response.data, response.status_code), timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,69 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import request_audience
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified on list and retrieve. Validators come from one
+    aggregate query (max `last_modified_field` + count for lists, the row's
+    value for details), so a revalidation is answered with a 304 before the
+    view loads or serializes anything.
+
+    For posts that's `changed_at`: writes that change a post's representation
+    without saving the post (comments, images, tag/category renames) touch it
+    from blog.signals to keep the validators honest.
+    """
+    last_modified_field = 'changed_at'
+
+    def _etag(self, request, last_modified, parts):
+        raw = '|'.join(map(str, [
+            type(self).__name__,
+            request.path,
+            sorted(request.query_params.lists()),
+            request.accepted_media_type,
+            request_audience(request),
+            last_modified.isoformat() if last_modified else '',
+            *parts,
+        ]))
+        return f'"{hashlib.sha256(raw.encode()).hexdigest()}"'
+
+    def _conditional(self, handler, last_modified, parts, request, *args, **kwargs):
+        etag = self._etag(request, last_modified, parts)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        state = queryset.aggregate(last_modified=Max(self.last_modified_field), count=Count('pk'))
+        return self._conditional(super().list, state['last_modified'], [state['count']], request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = self.kwargs[lookup_url_kwarg]
+        try:
+            last_modified = (
+                self.filter_queryset(self.get_queryset())
+                .filter(**{self.lookup_field: lookup})
+                .values_list(self.last_modified_field, flat=True)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            last_modified = None  # e.g. /api/posts/abc/
+        if last_modified is None:
+            # let the normal path produce the 404
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional(super().retrieve, last_modified, [lookup], request, *args, **kwargs)
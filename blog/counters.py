@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import invalidate_tags
+
+_deferred = ContextVar('blog_counters_deferred', default=False)
+
+# Post counters the listings show; only changes to these bump the 'posts' tag.
+# (An unapproved comment changes comment_count, which only the detail shows.)
+LISTED_POST_COUNTERS = ('approved_comment_count', 'image_count')
+
+
+@contextmanager
+def deferred():
+    """
+    Skip the per-row counter/invalidation signals inside the block; the
+    caller adjusts counters once per post instead (bulk moderation).
+    """
+    token = _deferred.set(True)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+
+
+def is_deferred():
+    return _deferred.get()
+
+
+def _adjust(model, filters, **deltas):
+    # Single UPDATE with F() so concurrent writers can't lose increments;
+    # clamped at 0 so drift never trips the PositiveIntegerField check.
+    if not deltas or not any(deltas.values()):
+        return
+    changes = {field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items() if delta}
+    model._default_manager.filter(**filters).update(**changes)
+
+
+def adjust_post(post_id, **deltas):
+    from .models import Post
+
+    _adjust(Post, {'pk': post_id}, **deltas)
+    if any(deltas.get(field) for field in LISTED_POST_COUNTERS):
+        invalidate_tags('posts', f'post:{post_id}')
+    elif any(deltas.values()):
+        invalidate_tags(f'post:{post_id}')
+
+
+def adjust_tags(tag_ids, delta):
+    from .models import Tag
+
+    if tag_ids:
+        _adjust(Tag, {'pk__in': list(tag_ids)}, post_count=delta)
+        invalidate_tags('tags')
+
+
+def adjust_category(category_id, delta):
+    from .models import Category
+
+    if category_id:
+        _adjust(Category, {'pk': category_id}, post_count=delta)
+        invalidate_tags('categories')
+
+
+def _count(queryset, outer_field):
+    counted = (
+        queryset.filter(**{outer_field: OuterRef('pk')})
+        .order_by()
+        .values(outer_field)
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def _repair(queryset, actual):
+    # Only rewrite rows whose stored value drifted; returns their ids.
+    annotated = queryset.annotate(**{f'actual_{field}': expr for field, expr in actual.items()})
+    drifted = Q()
+    for field in actual:
+        drifted |= ~Q(**{field: F(f'actual_{field}')})
+    ids = list(annotated.filter(drifted).values_list('pk', flat=True))
+    if ids:
+        queryset.filter(pk__in=ids).update(**actual)
+    return ids
+
+
+def recount(apps=global_apps):
+    """
+    Recompute every counter from the source rows. Returns {model: rows fixed}.
+    """
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+    PostImage = apps.get_model('blog', 'PostImage')
+    Tag = apps.get_model('blog', 'Tag')
+    Category = apps.get_model('blog', 'Category')
+    PostTags = Post.tags.through
+
+    post_ids = _repair(Post.objects.all(), {
+        'comment_count': _count(Comment.objects.all(), 'post'),
+        'approved_comment_count': _count(Comment.objects.filter(approved=True), 'post'),
+        'image_count': _count(PostImage.objects.all(), 'post'),
+    })
+    tag_ids = _repair(Tag.objects.all(), {
+        'post_count': _count(PostTags.objects.filter(post__published=True), 'tag'),
+    })
+    category_ids = _repair(Category.objects.all(), {
+        'post_count': _count(Post.objects.filter(published=True), 'category'),
+    })
+
+    if post_ids:
+        invalidate_tags('posts', *(f'post:{pk}' for pk in post_ids))
+    if tag_ids:
+        invalidate_tags('tags')
+    if category_ids:
+        invalidate_tags('categories')
+    return {'post': len(post_ids), 'tag': len(tag_ids), 'category': len(category_ids)}
@@ -0,0 +1,146 @@
+import io
+import logging
+import posixpath
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from .cache import invalidate_tags
+from .mediacache import existence_batch
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {'webp': 'image/webp', 'avif': 'image/avif', 'jpeg': 'image/jpeg'}
+
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def available_formats():
+    formats = []
+    for fmt in settings.IMAGE_DERIVATIVE_FORMATS:
+        if fmt == 'jpeg' or features.check(fmt):
+            formats.append(fmt)
+    return formats
+
+
+def derivative_name(source, width, fmt):
+    folder, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(folder, 'derivatives', f'{stem}__{width}w.{fmt}')
+
+
+def build_variants(fieldfile):
+    """
+    Resize `fieldfile` to the configured widths in every available format and
+    save them next to the original. Returns the variants mapping stored on the
+    model: {'source': name, '<fmt>': [{'width', 'height', 'name'}, ...]}.
+    """
+    storage = fieldfile.storage
+    with storage.open(fieldfile.name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    widths = [w for w in settings.IMAGE_DERIVATIVE_WIDTHS if w < original.width] or [original.width]
+    formats = available_formats()
+    names = [derivative_name(fieldfile.name, width, fmt) for fmt in formats for width in widths]
+    with existence_batch(storage, names):
+        return _save_variants(storage, fieldfile.name, original, widths, formats)
+
+
+def _save_variants(storage, source, original, widths, formats):
+    variants = {'source': source}
+    for fmt in formats:
+        variants[fmt] = []
+        for width in widths:
+            height = max(1, round(original.height * width / original.width))
+            image = original.resize((width, height), Image.LANCZOS)
+            if fmt == 'jpeg':
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+            buffer = io.BytesIO()
+            image.save(buffer, format=fmt.upper(), quality=settings.IMAGE_DERIVATIVE_QUALITY)
+            content = ContentFile(buffer.getvalue())
+            content.content_type = CONTENT_TYPES[fmt]
+            name = storage.save(derivative_name(source, width, fmt), content)
+            variants[fmt].append({'width': image.width, 'height': image.height, 'name': name})
+    return variants
+
+
+def srcset(storage, variants):
+    """
+    {'webp': 'https://.../a__320w.webp 320w, ...', ...} for the stored variants.
+    """
+    return {
+        fmt: ', '.join(f"{storage.url(v['name'])} {v['width']}w" for v in entries)
+        for fmt, entries in (variants or {}).items()
+        if fmt != 'source'
+    }
+
+
+def process(model_label, pk, field_name, variants_field):
+    from django.apps import apps
+    from .signals import touch_posts
+
+    model = apps.get_model(model_label)
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile or getattr(instance, variants_field).get('source') == fieldfile.name:
+        return
+
+    variants = build_variants(fieldfile)
+    # only record them if the file wasn't replaced while we were working
+    model._default_manager.filter(pk=pk, **{field_name: fieldfile.name}).update(**{variants_field: variants})
+
+    if model_label == 'blog.Post':
+        touch_posts(pk=pk)
+        invalidate_tags('posts', f'post:{pk}')
+    else:
+        touch_posts(pk=instance.post_id)
+        invalidate_tags(f'post:{instance.post_id}')
+
+
+def _work():
+    while True:
+        job = _jobs.get()
+        try:
+            process(*job)
+        except Exception:
+            logger.exception('Image derivative job %s failed', job)
+        finally:
+            close_old_connections()
+            _jobs.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='image-derivatives', daemon=True)
+            _worker.start()
+
+
+def schedule(instance, field_name, variants_field):
+    """
+    Queue derivative generation for `instance.<field_name>` once the current
+    transaction commits. Runs inline when IMAGE_DERIVATIVES_SYNC is set.
+    """
+    job = (instance._meta.label, instance.pk, field_name, variants_field)
+
+    def enqueue():
+        if settings.IMAGE_DERIVATIVES_SYNC:
+            process(*job)
+            return
+        _ensure_worker()
+        _jobs.put(job)
+
+    transaction.on_commit(enqueue)
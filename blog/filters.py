@@ -0,0 +1,54 @@
+from datetime import datetime, time
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import filters, serializers
+
+
+def visible_posts(queryset, user):
+    """
+    Anonymous readers only get published posts; authors also see their drafts.
+    """
+    if user and user.is_authenticated:
+        return queryset.filter(Q(published=True) | Q(author=user))
+    return queryset.filter(published=True)
+
+
+def _parse_moment(value, end_of_day=False):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise serializers.ValidationError({'detail': f'Invalid date: {value}'})
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class PostFilterBackend(filters.BaseFilterBackend):
+    """
+    ?category=<slug>  ?tag=<slug>  ?author=<username>  ?published=true|false
+    ?created_after=<date|datetime>  ?created_before=<date|datetime>
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get('category'):
+            queryset = queryset.filter(category__slug=params['category'])
+        if params.get('tag'):
+            queryset = queryset.filter(tags__slug=params['tag'])
+        if params.get('author'):
+            queryset = queryset.filter(author__username=params['author'])
+        if params.get('published'):
+            value = params['published'].lower()
+            if value not in ('true', 'false', '1', '0'):
+                raise serializers.ValidationError({'detail': 'published must be true or false.'})
+            queryset = queryset.filter(published=value in ('true', '1'))
+        if params.get('created_after'):
+            queryset = queryset.filter(created_at__gte=_parse_moment(params['created_after']))
+        if params.get('created_before'):
+            queryset = queryset.filter(created_at__lte=_parse_moment(params['created_before'], end_of_day=True))
+        return queryset
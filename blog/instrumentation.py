@@ -0,0 +1,192 @@
+"""
+Per-request timings: total, ORM queries, serializers and storage calls.
+
+instrumentation_middleware collects them into a contextvar while the request
+runs and reports them as a `Server-Timing` header plus a sampled JSON log line
+on the `blog.perf` logger. Slow requests (PERF_SLOW_REQUEST_MS) are always
+logged, as warnings. Logging is queued (blog/logconfig.py), so the request
+never waits on the file.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('blog.perf')
+
+_current = ContextVar('request_timings', default=None)
+_storage_lock = threading.Lock()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.storage_count = 0
+        self.storage_time = 0.0
+
+    def as_dict(self):
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'db_queries': self.db_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'serializer_ms': round(self.serializer_time * 1000, 2),
+            'storage_calls': self.storage_count,
+            'storage_ms': round(self.storage_time * 1000, 2),
+        }
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_count += 1
+        timings.db_time += time.perf_counter() - started
+
+
+def _instrument(conn):
+    if _time_query not in conn.execute_wrappers:
+        conn.execute_wrappers.append(_time_query)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Every connection, on whichever thread it lives: under ASGI the queries
+    # run on sync_to_async's worker thread, not the one the middleware is on.
+    # _time_query does nothing outside a request.
+    _instrument(connection)
+
+
+@contextmanager
+def storage_call():
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _storage_lock:  # uploads run on a thread pool
+            timings.storage_count += 1
+            timings.storage_time += elapsed
+
+
+class TimedSerializerMixin:
+    """
+    Adds serializer time to the request timings. Only the outermost
+    to_representation counts, so nested serializers aren't counted twice.
+    """
+
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or timings.serializer_depth:
+            return super().to_representation(instance)
+        timings.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serializer_depth -= 1
+            timings.serializer_time += time.perf_counter() - started
+
+
+class InstrumentedStorageMixin:
+    """
+    Counts and times the storage calls that can go over the network.
+    """
+
+    def _open(self, name, mode='rb'):
+        with storage_call():
+            return super()._open(name, mode)
+
+    def _save(self, name, content):
+        with storage_call():
+            return super()._save(name, content)
+
+    def delete(self, name):
+        with storage_call():
+            return super().delete(name)
+
+    def exists(self, name):
+        with storage_call():
+            return super().exists(name)
+
+    def size(self, name):
+        with storage_call():
+            return super().size(name)
+
+    def listdir(self, path):
+        with storage_call():
+            return super().listdir(path)
+
+    def url(self, name, *args, **kwargs):
+        with storage_call():
+            return super().url(name, *args, **kwargs)
+
+
+def server_timing(data):
+    return ', '.join([
+        f'db;dur={data["db_ms"]};desc="{data["db_queries"]} queries"',
+        f'ser;dur={data["serializer_ms"]}',
+        f'storage;dur={data["storage_ms"]};desc="{data["storage_calls"]} calls"',
+        f'total;dur={data["total_ms"]}',
+    ])
+
+
+def _report(request, response, timings):
+    data = timings.as_dict()
+    if settings.PERF_SERVER_TIMING:
+        response['Server-Timing'] = server_timing(data)
+
+    slow = data['total_ms'] >= settings.PERF_SLOW_REQUEST_MS
+    if slow or random.random() < settings.PERF_LOG_SAMPLE_RATE:
+        entry = {'method': request.method, 'path': request.path, 'status': response.status_code, 'slow': slow, **data}
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(entry))
+    return response
+
+
+@contextmanager
+def _collect():
+    timings = RequestTimings()
+    token = _current.set(timings)
+    # connections opened before this module was imported
+    for conn in connections.all(initialized_only=True):
+        _instrument(conn)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with _collect() as timings:
+                response = await get_response(request)
+            return _report(request, response, timings)
+    else:
+        def middleware(request):
+            with _collect() as timings:
+                response = get_response(request)
+            return _report(request, response, timings)
+    return middleware
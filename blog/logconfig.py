@@ -0,0 +1,161 @@
+"""
+Logging setup: everything goes through one QueueHandler, and a listener
+thread formats and writes the records to a file (or stdout), so a log call
+on the request thread is just a queue put. Levels come from a per-environment
+profile (DJANGO_LOG_PROFILE), and the chatty libraries (botocore & co.) are
+rate-limited on top of that.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# logger -> level, per environment
+PROFILES = {
+    'production': {
+        'django': 'WARNING',
+        'django.request': 'ERROR',
+        'blog': 'INFO',
+        'boto3': 'WARNING',
+        'botocore': 'WARNING',
+        's3transfer': 'WARNING',
+    },
+    'development': {
+        'django': 'INFO',
+        'blog': 'DEBUG',
+        'boto3': 'INFO',
+        'botocore': 'INFO',
+        's3transfer': 'INFO',
+    },
+    # wire-level S3 debugging; the rate limit keeps it from flooding the disk
+    'debug': {
+        'django': 'DEBUG',
+        'django.db.backends': 'DEBUG',
+        'blog': 'DEBUG',
+        'boto3': 'DEBUG',
+        'botocore': 'DEBUG',
+        's3transfer': 'DEBUG',
+    },
+}
+
+NOISY_LOGGERS = ('boto3', 'botocore', 's3transfer', 'django.db.backends')
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per noisy logger (children included, e.g. botocore.endpoint
+    counts as botocore): lets `rate` records a second through, with bursts up
+    to `burst`, and drops the rest. Other loggers and WARNING and above always
+    pass. The next record that gets through says how many were dropped.
+
+    Goes on the handler: logger filters don't see records from child loggers.
+    """
+
+    def __init__(self, rate=20, burst=100, loggers=NOISY_LOGGERS):
+        super().__init__()
+        self.rate, self.burst, self.loggers = rate, burst, loggers
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket_name(self, name):
+        for logger in self.loggers:
+            if name == logger or name.startswith(logger + '.'):
+                return logger
+        return None
+
+    def filter(self, record):
+        bucket = self._bucket_name(record.name)
+        if bucket is None or record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, dropped = self._buckets.get(bucket, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[bucket] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[bucket] = (tokens - 1, now, 0)
+        if dropped:
+            record.msg = f'[{dropped} records dropped by rate limit] {record.msg}'
+        return True
+
+
+class BackgroundFileHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler with its own QueueListener writing to `filename`. Records are
+    formatted on the listener thread, not the caller's.
+
+    With maxBytes the file is size-rotated in-process, which is only safe with
+    a single process writing it (runserver). Without, it's a WatchedFileHandler
+    that reopens the file once logrotate & co. have moved it, so any number of
+    gunicorn workers can share it. filename '-' writes to stdout instead.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=5, encoding='utf-8'):
+        super().__init__(queue.Queue())  # Queue, not SimpleQueue: flush() joins it
+        if filename == '-':
+            self.target = logging.StreamHandler(sys.stdout)
+        elif maxBytes:
+            self.target = logging.handlers.RotatingFileHandler(
+                filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=True,
+            )
+        else:
+            self.target = logging.handlers.WatchedFileHandler(filename, encoding=encoding, delay=True)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # the formatter belongs to the file handler on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # same process, so no need to pre-format or make the record picklable
+        return record
+
+    def flush(self):
+        """
+        Block until everything queued so far is written.
+        """
+        self.queue.join()
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+            self.target.close()
+        super().close()
+
+
+def build_logging(filename, profile='production', max_bytes=0, backup_count=5, noisy_rate=20):
+    """
+    The LOGGING dict for `profile` (see PROFILES). max_bytes=0 leaves rotating
+    `filename` to something outside the process (see BackgroundFileHandler).
+    """
+    levels = PROFILES[profile]
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        },
+        'filters': {
+            'rate_limited': {'()': RateLimitFilter, 'rate': noisy_rate, 'burst': noisy_rate * 5},
+        },
+        'handlers': {
+            'file': {
+                'class': 'blog.logconfig.BackgroundFileHandler',
+                'filename': str(filename),
+                'maxBytes': max_bytes,
+                'backupCount': backup_count,
+                'formatter': 'plain',
+                'filters': ['rate_limited'],
+            },
+        },
+        'loggers': {
+            name: {'handlers': ['file'], 'level': level, 'propagate': False}
+            for name, level in levels.items()
+        },
+    }
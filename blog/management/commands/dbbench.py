@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What Django gave us before SQLITE_PRAGMAS: rollback journal, full sync.
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks reads during writes on a scratch SQLite file, once with the stock '
+        'rollback journal and once with settings.SQLITE_PRAGMAS (WAL). Does not touch the project database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--rows', type=int, default=20000, help='Comments seeded before the run.')
+
+    def handle(self, *args, **options):
+        for label, pragmas in (('rollback journal', DEFAULT_PRAGMAS), ('tuned (WAL)', settings.SQLITE_PRAGMAS)):
+            with tempfile.TemporaryDirectory() as tmp:
+                result = self.run(os.path.join(tmp, 'bench.sqlite3'), pragmas, options)
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {label}: {result["reads"] / result["elapsed"]:.0f} reads/s '
+                f'(mean {result["mean"]:.2f} ms, p99 {result["p99"]:.2f} ms, {result["read_errors"]} locked), '
+                f'{result["writes"] / result["elapsed"]:.0f} writes/s ({result["write_errors"]} locked)'
+            ))
+
+    def connect(self, path, pragmas):
+        conn = sqlite3.connect(path, timeout=pragmas.get('busy_timeout', 5000) / 1000, isolation_level=None, check_same_thread=False)
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def run(self, path, pragmas, options):
+        setup = self.connect(path, pragmas)
+        setup.execute('CREATE TABLE comment (id INTEGER PRIMARY KEY, post_id INTEGER, body TEXT, created_at REAL)')
+        setup.execute('CREATE INDEX comment_post_idx ON comment (post_id, created_at)')
+        setup.executemany(
+            'INSERT INTO comment (post_id, body, created_at) VALUES (?, ?, ?)',
+            ((i % 100, 'x' * 200, time.time()) for i in range(options['rows'])),
+        )
+        setup.close()
+
+        stop = threading.Event()
+        stats = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def writer():
+            conn = self.connect(path, pragmas)
+            post = 0
+            while not stop.is_set():
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.execute('INSERT INTO comment (post_id, body, created_at) VALUES (?, ?, ?)', (post % 100, 'y' * 200, time.time()))
+                    conn.execute('COMMIT')
+                    stats['writes'] += 1
+                except sqlite3.OperationalError:
+                    stats['write_errors'] += 1
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                post += 1
+            conn.close()
+
+        def reader(n):
+            conn = self.connect(path, pragmas)
+            local, errors, post = [], 0, n
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.execute(
+                        'SELECT id, body FROM comment WHERE post_id = ? ORDER BY created_at DESC LIMIT 20', (post % 100,)
+                    ).fetchall()
+                    local.append(time.perf_counter() - started)
+                except sqlite3.OperationalError:
+                    errors += 1
+                post += 1
+            conn.close()
+            with lock:
+                latencies.extend(local)
+                stats['reads'] += len(local)
+                stats['read_errors'] += errors
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(n,)) for n in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        mean = sum(latencies) / len(latencies) * 1000 if latencies else 0
+        return {**stats, 'elapsed': elapsed, 'mean': mean, 'p99': p99}
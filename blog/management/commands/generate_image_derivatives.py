@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from blog.derivatives import process
+from blog.models import Post, PostImage
+
+
+class Command(BaseCommand):
+    help = 'Generates resized WebP/AVIF derivatives for post images that are missing them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate even if variants are already recorded.')
+
+    def handle(self, *args, **options):
+        targets = [
+            (Post.objects.exclude(featured_image='').exclude(featured_image__isnull=True), 'featured_image', 'featured_image_variants'),
+            (PostImage.objects.all(), 'image', 'variants'),
+        ]
+        done = failed = 0
+        for queryset, field_name, variants_field in targets:
+            if options['force']:
+                queryset.update(**{variants_field: {}})
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                try:
+                    process(queryset.model._meta.label, pk, field_name, variants_field)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(f'❌ {queryset.model.__name__} {pk}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Processed {done} images ({failed} failed).'))
@@ -0,0 +1,61 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Fires concurrent GETs at one or more URLs and reports throughput and latency. '
+        'To compare WSGI and ASGI, serve the project both ways, e.g. '
+        '`gunicorn BlogBackend.wsgi -w 4 -b :8000` and `uvicorn BlogBackend.asgi:application --workers 4 --port 8001`, then '
+        '`manage.py loadtest http://127.0.0.1:8000/api/posts/ http://127.0.0.1:8001/api/async/posts/`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per URL.')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--header', action='append', default=[], help='Extra "Name: value" header, e.g. an Authorization header.')
+
+    def handle(self, *args, **options):
+        headers = dict(h.split(':', 1) for h in options['header'])
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+
+        for url in options['urls']:
+            latencies, failures, elapsed = self.run(url, headers, options)
+            if not latencies:
+                self.stdout.write(self.style.ERROR(f'❌ {url}: all {failures} requests failed'))
+                continue
+
+            latencies.sort()
+            pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {url}\n'
+                f'   {len(latencies) / elapsed:.1f} req/s over {elapsed:.2f}s, {failures} failed\n'
+                f'   latency ms: mean {statistics.mean(latencies) * 1000:.1f}, '
+                f'p50 {pct(0.50):.1f}, p95 {pct(0.95):.1f}, p99 {pct(0.99):.1f}'
+            ))
+
+    def run(self, url, headers, options):
+        def hit(_):
+            request = urllib.request.Request(url, headers=headers)
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError):
+                return None
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(hit, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = [r for r in results if r is not None]
+        return latencies, len(results) - len(latencies), elapsed
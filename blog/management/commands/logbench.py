@@ -0,0 +1,63 @@
+import logging
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.logconfig import BackgroundFileHandler, RateLimitFilter
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the logging cost a request pays: the old synchronous DEBUG FileHandler '
+        'against the queued handler from blog/logconfig.py, on scratch files.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--lines', type=int, default=40, help='DEBUG lines per request (botocore logs dozens per S3 call).')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            variants = [
+                ('sync FileHandler, DEBUG (old config)', self.sync_handler(tmp), logging.DEBUG),
+                ('queued, DEBUG', self.queued_handler(tmp, 'unlimited', rate_limit=False), logging.DEBUG),
+                ('queued, DEBUG, rate-limited', self.queued_handler(tmp, 'debug'), logging.DEBUG),
+                ('queued, production levels', self.queued_handler(tmp, 'production'), logging.WARNING),
+            ]
+            for label, handler, level in variants:
+                mean, p99 = self.run(label, handler, level, options)
+                self.stdout.write(self.style.SUCCESS(f'✅ {label}: {mean:.3f} ms/request mean, p99 {p99:.3f} ms'))
+                handler.close()
+
+    def sync_handler(self, tmp):
+        handler = logging.FileHandler(os.path.join(tmp, 'sync.log'))
+        handler.setFormatter(logging.Formatter(FORMAT))
+        return handler
+
+    def queued_handler(self, tmp, name, rate_limit=True):
+        handler = BackgroundFileHandler(os.path.join(tmp, f'{name}.log'))
+        handler.setFormatter(logging.Formatter(FORMAT))
+        if rate_limit:
+            handler.addFilter(RateLimitFilter(loggers=('logbench',)))
+        return handler
+
+    def run(self, label, handler, level, options):
+        logger = logging.getLogger(f'logbench.{label}')
+        logger.handlers, logger.propagate = [handler], False
+        logger.setLevel(level)
+
+        timings = []
+        for request in range(options['requests']):
+            started = time.perf_counter()
+            for line in range(options['lines']):
+                logger.debug('Response headers: %s', {'x-amz-request-id': f'{request}-{line}', 'content-length': '1024'})
+            timings.append((time.perf_counter() - started) * 1000)
+
+        if hasattr(handler, 'flush'):
+            handler.flush()
+        timings.sort()
+        return sum(timings) / len(timings), timings[int(len(timings) * 0.99)]
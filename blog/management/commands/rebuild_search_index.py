@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.models import Post
+from blog.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index for all posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            self.stderr.write(self.style.ERROR('❌ No search backend for this database.'))
+            return
+
+        start = time.monotonic()
+        posts = Post.objects.prefetch_related('tags').order_by('pk')
+        batch_size = options['batch_size']
+        count = 0
+        with transaction.atomic():
+            backend.clear()
+            for post in posts.iterator(chunk_size=batch_size):
+                backend.index(post)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {count} posts in {time.monotonic() - start:.2f}s.'))
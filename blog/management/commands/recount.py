@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized comment/image/post counters and repairs any drift.'
+
+    def handle(self, *args, **options):
+        fixed = recount()
+        summary = ', '.join(f'{count} {model} rows' for model, count in fixed.items())
+        self.stdout.write(self.style.SUCCESS(f'✅ Counters repaired: {summary}.'))
@@ -1,27 +1,20 @@
 import uuid
 from django.core.management.base import BaseCommand
-import boto3
 from django.conf import settings
 
+from blog.s3 import get_client
+
 
 class Command(BaseCommand):
     help = 'Uploads a test file to the configured S3 (DigitalOcean Spaces) bucket.'
 
     def handle(self, *args, **kwargs):
         # Fetch S3 settings from Django settings.py
-        access_key = settings.AWS_ACCESS_KEY_ID
-        secret_key = settings.AWS_SECRET_ACCESS_KEY
         bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        endpoint_url = settings.AWS_S3_ENDPOINT_URL
         cdn_domain = getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', f"{bucket_name}.nyc3.cdn.digitaloceanspaces.com")
 
-        # Initialize boto3 client
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            endpoint_url=endpoint_url,
-        )
+        # The project's shared S3 client (blog/s3.py)
+        s3 = get_client()
 
         # Create and upload a test file
         file_key = f"s3test/{uuid.uuid4()}.txt"
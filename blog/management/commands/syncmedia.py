@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.mediasync import COPIED, FAILED, MISSING, SKIPPED, Checkpoint, MediaSync, media_names, open_storage
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies every media file the database references (featured images, post images, profile images '
+        'and their derivatives) from one storage to another, skipping the ones that are already there '
+        'unchanged. Storages are a STORAGES alias, s3://bucket[/location] or a local directory, e.g. '
+        '`manage.py syncmedia --to /srv/staging-media --checkpoint sync.ckpt`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='source', default='default', help='Source storage (default: the default storage).')
+        parser.add_argument('--to', dest='dest', required=True, help='Destination storage.')
+        parser.add_argument('--workers', type=int, default=8, help='Transfers running at once.')
+        parser.add_argument('--multipart-threshold', type=int, default=8, help='MB; larger S3 transfers go multipart.')
+        parser.add_argument('--chunk-size', type=int, default=8, help='MB per multipart part / read.')
+        parser.add_argument('--checkpoint', help='Resume file; names already synced are skipped. Removed after a clean run.')
+        parser.add_argument('--progress', type=int, default=100, help='Print a progress line every N files.')
+
+    def handle(self, *args, **options):
+        sync = MediaSync(
+            open_storage(options['source']), open_storage(options['dest']), workers=options['workers'],
+            multipart_threshold=options['multipart_threshold'] * MB, chunk_size=options['chunk_size'] * MB,
+        )
+        names = list(media_names())
+        checkpoint = Checkpoint(options['checkpoint'])
+        if checkpoint.done:
+            self.stdout.write(f'Resuming: {len(checkpoint.done)} of {len(names)} files done in an earlier run.')
+
+        counts = dict.fromkeys((COPIED, SKIPPED, MISSING, FAILED), 0)
+        copied_bytes = 0
+        started = time.perf_counter()
+        try:
+            for result in sync.run(names, checkpoint):
+                counts[result.status] += 1
+                copied_bytes += result.bytes
+                if result.status == FAILED:
+                    self.stderr.write(self.style.ERROR(f'❌ {result.name}: {result.error}'))
+                elif result.status == MISSING:
+                    self.stderr.write(self.style.WARNING(f'{result.name} is referenced but not in the source storage'))
+                elif options['verbosity'] > 1:
+                    self.stdout.write(f'{result.status} {result.name}')
+                finished = sum(counts.values())
+                if options['progress'] and finished % options['progress'] == 0:
+                    self.stdout.write(f'… {finished} files, {self.rate(copied_bytes, started)}')
+        finally:
+            # interrupted or crashed: what got written is flushed and kept for the rerun
+            checkpoint.close()
+        if not counts[FAILED]:
+            checkpoint.discard()
+
+        elapsed = time.perf_counter() - started
+        summary = (
+            f'{counts[COPIED]} copied ({copied_bytes / MB:.1f} MB), {counts[SKIPPED]} unchanged, '
+            f'{counts[MISSING]} missing, {counts[FAILED]} failed in {elapsed:.1f}s '
+            f'({self.rate(copied_bytes, started)}, {sum(counts.values()) / max(elapsed, 1e-9):.1f} files/s)'
+        )
+        if counts[FAILED]:
+            raise CommandError(f'{summary}. Rerun to retry them; with a --checkpoint the finished ones are skipped.')
+        self.stdout.write(self.style.SUCCESS(f'✅ {summary}'))
+
+    def rate(self, copied_bytes, started):
+        return f'{copied_bytes / MB / max(time.perf_counter() - started, 1e-9):.1f} MB/s'
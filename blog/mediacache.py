@@ -0,0 +1,238 @@
+"""
+Caches in front of the media storage, so serializing a page of posts doesn't
+go back to the storage for every image.
+
+- url() is memoized per name (MEDIA_URL_CACHE_TTL; presigned URLs are kept
+  for at most half of their lifetime).
+- exists()/size() answers go into an LRU with a TTL. Only "it exists" is
+  cached: a cached "missing" could make get_available_name() hand out a name
+  another process has just taken, and S3 would silently overwrite it.
+- existence_batch() lists the names a bulk save is about to use once up
+  front, and get_available_name() is answered from that listing instead of
+  one HEAD per file. Unlike the LRU, the listing answers "missing" too: it is
+  taken right before the saves and dropped after them, so it is no more
+  racy than the HEAD-then-PUT it replaces.
+"""
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .instrumentation import storage_call
+
+_MISSING = object()
+
+# keys listed per prefix: one ListObjectsV2 page; a prefix with more is probed
+LIST_LIMIT = 1000
+
+_batch = ContextVar('media_existence_batch', default=None)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ExistenceBatch:
+    """
+    What's stored under a few listed prefixes, kept up to date by the saves
+    and deletes made while the batch is active.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.listed = {}  # prefix -> set of stored names
+        self._lock = threading.Lock()
+
+    def lookup(self, name):
+        """
+        True/False if a listing covers `name`, None if it doesn't.
+        """
+        with self._lock:
+            for prefix, names in self.listed.items():
+                if name.startswith(prefix):
+                    return name in names
+        return None
+
+    def saved(self, name):
+        with self._lock:
+            for prefix, names in self.listed.items():
+                if name.startswith(prefix):
+                    names.add(name)
+
+    def deleted(self, name):
+        with self._lock:
+            for names in self.listed.values():
+                names.discard(name)
+
+
+def _prefixes(names):
+    """
+    One listing prefix per directory: the directory plus whatever the file
+    names in it have in common (extension left out, since the names
+    get_available_name() tries next are `<root>_<random><ext>`). Directories
+    whose names have nothing in common are left out; listing all of them
+    would cost more than probing the few names.
+    """
+    folders = {}
+    for name in names:
+        folder, filename = posixpath.split(name)
+        folders.setdefault(folder, []).append(posixpath.splitext(filename)[0])
+    prefixes = []
+    for folder, roots in folders.items():
+        common = posixpath.commonprefix(roots)
+        if common:
+            prefixes.append(posixpath.join(folder, common) if folder else common)
+    return prefixes
+
+
+class CachedStorageMixin:
+    """
+    URL and metadata caches for a storage (see the module docstring). Put it
+    first in the bases so cache hits don't show up as storage calls in the
+    request timings.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url_ttl = settings.MEDIA_URL_CACHE_TTL
+        if getattr(self, 'querystring_auth', False):
+            self.url_ttl = min(self.url_ttl, self.querystring_expire / 2)
+        self._urls = TTLCache(settings.MEDIA_URL_CACHE_SIZE, self.url_ttl)
+        self._metadata = TTLCache(settings.MEDIA_METADATA_CACHE_SIZE, settings.MEDIA_METADATA_CACHE_TTL)
+
+    def _active_batch(self):
+        batch = _batch.get()
+        return batch if batch is not None and batch.storage is self else None
+
+    def url(self, name, *args, **kwargs):
+        if args or kwargs or not name:
+            return super().url(name, *args, **kwargs)
+        url = self._urls.get(name)
+        if url is None:
+            url = super().url(name)
+            self._urls.set(name, url)
+        return url
+
+    def exists(self, name):
+        if self._metadata.get(name, _MISSING) is not _MISSING:
+            return True
+        batch = self._active_batch()
+        if batch is not None:
+            found = batch.lookup(name)
+            if found is not None:
+                return found
+        if not super().exists(name):
+            return False
+        self._metadata.set(name, None)  # exists, size not known yet
+        return True
+
+    def size(self, name):
+        size = self._metadata.get(name)
+        if size is None:
+            size = super().size(name)
+            self._metadata.set(name, size)
+        return size
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        self._metadata.set(name, None)
+        batch = self._active_batch()
+        if batch is not None:
+            batch.saved(name)
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        self._metadata.pop(name)
+        self._urls.pop(name)
+        batch = self._active_batch()
+        if batch is not None:
+            batch.deleted(name)
+
+    def _list_prefix(self, prefix):
+        """
+        The stored names that start with `prefix`, or None if there are more
+        than LIST_LIMIT (an incomplete listing can't say "missing").
+        """
+        if hasattr(self, 'bucket'):
+            key_prefix = self._normalize_name(prefix)
+            strip = len(key_prefix) - len(prefix)
+            with storage_call():
+                page = self.connection.meta.client.list_objects_v2(
+                    Bucket=self.bucket_name, Prefix=key_prefix, MaxKeys=LIST_LIMIT,
+                )
+            if page.get('IsTruncated'):
+                return None
+            return {obj['Key'][strip:] for obj in page.get('Contents', [])}
+        folder, start = posixpath.split(prefix)
+        try:
+            _, files = super().listdir(folder)
+        except FileNotFoundError:
+            files = []
+        names = {posixpath.join(folder, f) for f in files if f.startswith(start)}
+        return names if len(names) <= LIST_LIMIT else None
+
+    @contextmanager
+    def existence_batch(self, names):
+        batch = ExistenceBatch(self)
+        for prefix in _prefixes(names):
+            listed = self._list_prefix(prefix)
+            if listed is not None:
+                batch.listed[prefix] = listed
+        token = _batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _batch.reset(token)
+
+
+def existence_batch(storage, names):
+    """
+    Wrap a bulk save of `names` into `storage`: their directories are listed
+    once up front and exists() is answered from that. Does nothing for
+    storages without CachedStorageMixin.
+    """
+    if not names or not hasattr(storage, 'existence_batch'):
+        return nullcontext()
+    return storage.existence_batch(names)
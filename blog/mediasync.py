@@ -0,0 +1,204 @@
+"""
+Copy the media the database points at from one storage to another: Spaces
+bucket to bucket, or a bucket to a local directory for staging. Used by
+`manage.py syncmedia`.
+
+Objects that are already there with the same size and MD5 are skipped.
+Anything written to S3 gets its MD5 in the `md5` metadata, because multipart
+ETags aren't MD5s. Finished names go into an append-only checkpoint file, so
+an interrupted run picks up where it stopped.
+"""
+import hashlib
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from boto3.s3.transfer import TransferConfig
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+
+from .models import Post, PostImage
+
+COPIED, SKIPPED, MISSING, FAILED = 'copied', 'skipped', 'missing', 'failed'
+
+
+@dataclass
+class SyncResult:
+    name: str
+    status: str
+    bytes: int = 0
+    error: str = ''
+
+
+def _variant_names(variants):
+    for fmt, entries in (variants or {}).items():
+        if fmt != 'source':
+            yield from (entry['name'] for entry in entries)
+
+
+def media_names():
+    """
+    Every stored name the database references, once: featured images, post
+    images and profile images, plus the derivatives made from them.
+    """
+    seen = set()
+    sources = [
+        Post.objects.exclude(featured_image='').exclude(featured_image__isnull=True).values_list('featured_image', 'featured_image_variants'),
+        PostImage.objects.values_list('image', 'variants'),
+    ]
+    for queryset in sources:
+        for name, variants in queryset.iterator():
+            for n in (name, *_variant_names(variants)):
+                if n not in seen:
+                    seen.add(n)
+                    yield n
+    profiles = get_user_model().objects.exclude(profile_image='').exclude(profile_image__isnull=True)
+    for name in profiles.values_list('profile_image', flat=True).iterator():
+        if name not in seen:
+            seen.add(name)
+            yield name
+
+
+def open_storage(spec):
+    """
+    A STORAGES alias ('default'), s3://bucket[/location] for a MediaStorage on
+    another bucket, or a local directory.
+    """
+    if spec in settings.STORAGES:
+        return storages[spec]
+    if spec.startswith('s3://'):
+        from BlogBackend.storage_backends import MediaStorage
+
+        bucket, _, location = spec[len('s3://'):].partition('/')
+        return MediaStorage(bucket_name=bucket, **({'location': location} if location else {}))
+    return FileSystemStorage(location=spec)
+
+
+class Checkpoint:
+    """
+    The names a previous run finished, one per line. Appended to as
+    transfers complete (from one thread only).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    def add(self, name):
+        if self._file:
+            self._file.write(name + '\n')
+            self._file.flush()
+
+    def close(self):
+        if self._file and not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        """
+        Close and delete it: everything synced, nothing left to resume.
+        """
+        self.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _is_s3(storage):
+    return hasattr(storage, 'bucket')
+
+
+class MediaSync:
+    def __init__(self, source, dest, workers=8, multipart_threshold=8 * 1024 * 1024, chunk_size=8 * 1024 * 1024):
+        self.source, self.dest = source, dest
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=chunk_size, max_concurrency=4,
+        )
+
+    def checksum(self, storage, name):
+        """
+        MD5 hex of a stored object. S3 answers from our `md5` metadata or a
+        single-part ETag; anything else is read and hashed.
+        """
+        if _is_s3(storage):
+            obj = storage.bucket.Object(storage._normalize_name(name))
+            tag = obj.metadata.get('md5') or obj.e_tag.strip('"')
+            if '-' not in tag:
+                return tag
+        digest = hashlib.md5(usedforsecurity=False)
+        with storage.open(name, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def sync(self, name):
+        if not self.source.exists(name):
+            return SyncResult(name, MISSING)
+        size = self.source.size(name)
+        if self.dest.exists(name) and self.dest.size(name) == size:
+            if self.checksum(self.source, name) == self.checksum(self.dest, name):
+                return SyncResult(name, SKIPPED)
+        self.copy(name)
+        return SyncResult(name, COPIED, size)
+
+    def copy(self, name):
+        source, dest = self.source, self.dest
+        if not _is_s3(dest):
+            if dest.exists(name):
+                dest.delete(name)
+            with source.open(name, 'rb') as f:
+                content = File(f, name)
+                content.DEFAULT_CHUNK_SIZE = self.chunk_size
+                dest.save(name, content)
+            return
+
+        key = dest._normalize_name(name)
+        params = dest._get_write_parameters(key)
+        params['Metadata'] = {**params.get('Metadata', {}), 'md5': self.checksum(source, name)}
+        client = dest.connection.meta.client
+        if _is_s3(source) and source.connection.meta.client is client:
+            # same endpoint: server-side copy, multipart (UploadPartCopy) above the threshold
+            client.copy(
+                {'Bucket': source.bucket_name, 'Key': source._normalize_name(name)}, dest.bucket_name, key,
+                ExtraArgs={**params, 'MetadataDirective': 'REPLACE'}, Config=self.transfer_config,
+            )
+            return
+        with source.open(name, 'rb') as f:
+            # multipart upload above the threshold, parts sent concurrently
+            dest.bucket.Object(key).upload_fileobj(f, ExtraArgs=params, Config=self.transfer_config)
+
+    def _sync(self, name):
+        try:
+            return self.sync(name)
+        except Exception as e:
+            return SyncResult(name, FAILED, error=str(e) or e.__class__.__name__)
+
+    def run(self, names, checkpoint):
+        """
+        Sync `names`, yielding a SyncResult per name as transfers finish.
+        Names in the checkpoint are left alone; at most `workers` transfers
+        run at once and only a few more are queued.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='syncmedia') as pool:
+            pending = set()
+            for name in names:
+                if name in checkpoint.done:
+                    continue
+                pending.add(pool.submit(self._sync, name))
+                if len(pending) >= self.workers * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._finish(finished, checkpoint)
+            yield from self._finish(wait(pending).done, checkpoint)
+
+    def _finish(self, futures, checkpoint):
+        for future in futures:
+            result = future.result()
+            if result.status in (COPIED, SKIPPED):
+                checkpoint.add(result.name)
+            yield result
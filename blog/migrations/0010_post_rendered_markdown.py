@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+def render_posts(apps, schema_editor):
+    # save() is the only writer of the rendered fields; fill them in for
+    # existing rows
+    from blog.rendering import markdown_digest, render_markdown
+
+    Post = apps.get_model('blog', 'Post')
+    posts = Post.objects.using(schema_editor.connection.alias).only('pk', 'markdown')
+    for post in posts.iterator():
+        rendered = render_markdown(post.markdown)
+        Post.objects.using(schema_editor.connection.alias).filter(pk=post.pk).update(
+            rendered_html=rendered.html, toc=rendered.toc, excerpt=rendered.excerpt,
+            rendered_hash=markdown_digest(post.markdown),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rendered_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rendered_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(render_posts, migrations.RunPython.noop),
+    ]
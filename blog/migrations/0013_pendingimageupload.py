@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-17 23:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingImageUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('content_type', models.CharField(max_length=100)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_uploads', to='blog.post')),
+                ('image', models.OneToOneField(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.postimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['post', 'expires_at'], name='pendingupload_post_exp_idx')],
+            },
+        ),
+    ]
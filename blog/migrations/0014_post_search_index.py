@@ -0,0 +1,52 @@
+from django.db import migrations
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5(title, body, tags, tokenize='porter unicode61')",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS blog_post_fts"]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS blog_post_search (
+        post_id bigint PRIMARY KEY REFERENCES blog_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        title text NOT NULL,
+        body text NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS blog_post_search_document_idx ON blog_post_search USING GIN (document)",
+]
+POSTGRES_DROP = ["DROP TABLE IF EXISTS blog_post_search"]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+def populate(apps, schema_editor):
+    from blog.search import get_search_backend
+
+    backend = get_search_backend()
+    if backend is None:
+        return
+    Post = apps.get_model('blog', 'Post')
+    for post in Post.objects.using(schema_editor.connection.alias).iterator():
+        backend.index(post)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_pendingimageupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+            _run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
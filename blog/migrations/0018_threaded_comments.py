@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-17 23:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # every existing comment is top-level: its own thread, path is its id
+    Comment = apps.get_model('blog', 'Comment')
+    comments = list(Comment.objects.only('pk'))
+    for comment in comments:
+        comment.thread_id = comment.pk
+        comment.path = f'{comment.pk:010d}/'
+    Comment.objects.bulk_update(comments, ['thread', 'path'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_comment_moderation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'path'], name='comment_thread_path_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
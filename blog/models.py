@@ -2,10 +2,34 @@ from django.db import models
 from django.conf import settings
 from django.utils.text import slugify
 
+from .rendering import markdown_digest, render_markdown
+
+
+class LoadedValuesMixin:
+    """
+    Remembers the database values of `tracked_fields`, so save signals can
+    tell what a save actually changed (see blog.counters).
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        self._loaded_values = {name: self.__dict__.get(name) for name in self.tracked_fields}
+
+    def loaded_value(self, name):
+        return getattr(self, '_loaded_values', {}).get(name)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True, blank=True)
+    # published posts in this category, maintained by blog.counters
+    post_count = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -19,6 +43,8 @@ class Category(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(unique=True, blank=True)
+    # published posts with this tag, maintained by blog.counters
+    post_count = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -29,7 +55,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Post(models.Model):
+class Post(LoadedValuesMixin, models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     featured_image = models.ImageField(upload_to='post_images/', null=True, blank=True)
@@ -37,15 +63,62 @@ class Post(models.Model):
     markdown = models.TextField('Post Markdown content', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # the conditional GET validator: also moved by writes that change what a
+    # post looks like in the API without editing it (blog.signals.touch_posts)
+    changed_at = models.DateTimeField(auto_now=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='posts')
     tags = models.ManyToManyField(Tag, blank=True)
     published = models.BooleanField(default=False)
 
+    # Maintained by blog.counters
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    image_count = models.PositiveIntegerField(default=0, editable=False)
+
+    tracked_fields = ('published', 'category_id')
+
+    # Resized/re-encoded copies of featured_image, filled in by blog.derivatives
+    featured_image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Rendered form of `markdown`, written by save() whenever the markdown
+    # changes. `rendered_hash` is the digest of the markdown it was built from.
+    rendered_html = models.TextField(blank=True, editable=False)
+    toc = models.JSONField(default=list, blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    rendered_hash = models.CharField(max_length=64, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            # partial: Django filters booleans as a bare `WHERE published`,
+            # which only a partial index (not a leading column) can serve
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(published=True), name='post_published_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='post_category_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        update_fields = kwargs.get('update_fields')
+        writes_markdown = 'markdown' not in self.get_deferred_fields() and (update_fields is None or 'markdown' in update_fields)
+        if writes_markdown and self.render():
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'rendered_html', 'toc', 'excerpt', 'rendered_hash'}
         super().save(*args, **kwargs)
 
+    def render(self):
+        """
+        Re-render the markdown into the rendered fields if it changed since the
+        last render. Returns whether it did.
+        """
+        digest = markdown_digest(self.markdown)
+        if digest == self.rendered_hash:
+            return False
+        rendered = render_markdown(self.markdown)
+        self.rendered_html, self.toc, self.excerpt, self.rendered_hash = rendered.html, rendered.toc, rendered.excerpt, digest
+        return True
+
     def __str__(self):
         return self.title
 
@@ -53,12 +126,54 @@ class PostImage(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='post_images/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Resized/re-encoded copies of image, filled in by blog.derivatives
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'uploaded_at', 'id'], name='postimage_post_uploaded_idx'),
+        ]
 
     def __str__(self):
         return self.image.name
 
 
-class Comment(models.Model):
+class PendingImageUpload(models.Model):
+    """
+    A presigned direct-to-bucket upload. It holds one of the post's image
+    slots until it is finalized into a PostImage or expires. Finalized ones
+    are kept (pointing at their image) until they expire, so a retried
+    finalize gets the same image back.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='pending_uploads')
+    name = models.CharField(max_length=255, unique=True)
+    content_type = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    image = models.OneToOneField(PostImage, null=True, blank=True, editable=False, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'expires_at'], name='pendingupload_post_exp_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RevokedToken(models.Model):
+    """
+    A refresh token (by jti) that was rotated away or logged out. Checked
+    through the in-memory filter in blog.revocation, not per request.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class Comment(LoadedValuesMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -66,5 +181,39 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     approved = models.BooleanField(default=False)
 
+    # Threading: `thread` is the top-level comment (itself for top-level ones)
+    # and `path` the materialized path of zero-padded ids from it, so a whole
+    # thread is one `thread_id IN (...) ORDER BY path` query.
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    thread = models.ForeignKey('self', on_delete=models.CASCADE, null=True, editable=False, related_name='+')
+    path = models.CharField(max_length=255, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    tracked_fields = ('approved',)
+
+    PATH_STEP = 10
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+            models.Index(fields=['thread', 'path'], name='comment_thread_path_idx'),
+            # public reads (approved per post) and the staff moderation queue;
+            # partial because Django filters booleans as a bare column
+            models.Index(fields=['post', 'created_at', 'id'], condition=models.Q(approved=True), name='comment_post_approved_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(approved=False), name='comment_moderation_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding and self.parent_id:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if adding:
+            # the path needs our own id, so it's filled in right after the insert
+            prefix = self.parent.path if self.parent_id else ''
+            self.path = f'{prefix}{self.pk:0{self.PATH_STEP}d}/'
+            self.thread_id = self.parent.thread_id if self.parent_id else self.pk
+            Comment.objects.filter(pk=self.pk).update(path=self.path, thread=self.thread_id)
+
     def __str__(self):
         return f'Comment by {self.name} on {self.post}'
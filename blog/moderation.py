@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .counters import adjust_post, deferred
+from .models import Comment
+from .signals import touch_posts
+
+
+def _per_post(queryset):
+    return {
+        row['post']: row
+        for row in queryset.order_by().values('post').annotate(total=Count('pk'), approved_total=Count('pk', filter=Q(approved=True)))
+    }
+
+
+def approve_comments(ids):
+    """
+    Approve the given comments with one UPDATE; counters move once per post.
+    """
+    with transaction.atomic():
+        pending = Comment.objects.filter(pk__in=ids, approved=False)
+        per_post = _per_post(pending)
+        approved = pending.update(approved=True)
+        for post_id, row in per_post.items():
+            adjust_post(post_id, approved_comment_count=row['total'])
+        touch_posts(pk__in=per_post.keys())
+    return approved
+
+
+def _with_replies(ids):
+    # replies go with their parent (CASCADE), so they need counting too;
+    # one query per level, bounded by COMMENT_MAX_DEPTH
+    ids = set(ids)
+    level = ids
+    while level:
+        level = set(Comment.objects.filter(parent__in=level).values_list('pk', flat=True)) - ids
+        ids |= level
+    return ids
+
+
+def reject_comments(ids):
+    """
+    Delete the given comments (spam) and their replies; counters move once per post.
+    """
+    with transaction.atomic():
+        doomed = Comment.objects.filter(pk__in=_with_replies(ids))
+        per_post = _per_post(doomed)
+        with deferred():
+            rejected, _ = doomed.delete()
+        for post_id, row in per_post.items():
+            adjust_post(post_id, comment_count=-row['total'], approved_comment_count=-row['approved_total'])
+        touch_posts(pk__in=per_post.keys())
+    return rejected
@@ -0,0 +1,91 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _positive_int
+from rest_framework.utils.urls import replace_query_param
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination on (created_at, id). The cursor encodes the last row
+    seen, so every page is a single indexed range scan - no OFFSET.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class CommentCursorPagination(CreatedAtCursorPagination):
+    # Comments read oldest first.
+    ordering = ('created_at', 'id')
+
+
+class PostImageCursorPagination(CreatedAtCursorPagination):
+    ordering = ('uploaded_at', 'id')
+
+
+class AsyncKeysetPagination:
+    """
+    Forward-only keyset pages for the async read views (blog/async_views.py).
+    Same page size knobs and {next, previous, results} shape as the cursor
+    paginators above, but the page is fetched with `async for`. The cursor is
+    the (timestamp, id) of the last row, so it's always one range scan.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering):
+        # e.g. ('-created_at', '-id'); the last field must be the pk
+        self.ordering = ordering
+        self.next = None
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            moment, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            moment = parse_datetime(moment)
+            if moment is None:
+                raise ValueError
+            return moment, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, request, row):
+        field = self.ordering[0].lstrip('-')
+        position = json.dumps([getattr(row, field).isoformat(), row.pk])
+        encoded = base64.urlsafe_b64encode(position.encode()).decode()
+        return replace_query_param(request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def after(self, position):
+        field, pk_field = [name.lstrip('-') for name in self.ordering]
+        moment, pk = position
+        op = 'lt' if self.ordering[0].startswith('-') else 'gt'
+        return Q(**{f'{field}__{op}': moment}) | Q(**{field: moment, f'{pk_field}__{op}': pk})
+
+    async def paginate_queryset(self, queryset, request):
+        size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = [row async for row in queryset[:size + 1]]
+        self.next = self.encode_cursor(request, rows[size - 1]) if len(rows) > size else None
+        return rows[:size]
+
+    def get_paginated_data(self, data):
+        return {'next': self.next, 'previous': None, 'results': data}
@@ -0,0 +1,90 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def plan_queryset(queryset, serializer):
+    """
+    Add select_related/prefetch_related to `queryset` for every relation that
+    `serializer` is going to walk, so rendering a page costs a fixed number of
+    queries no matter how many rows it contains.
+    """
+    select, prefetch = _collect(serializer, queryset.model)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _collect(serializer, model, prefix='', skip=()):
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        # PrimaryKeyRelatedField & co. read the raw "<fk>_id" column.
+        if getattr(field, 'use_pk_only_optimization', lambda: False)():
+            continue
+
+        current, path = model, []
+        for attr in field.source.split('.'):
+            if current is None or (not path and attr in skip):
+                break
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            # "<fk>_id" resolves to the FK too, but it's just the raw column
+            if not model_field.is_relation or attr != model_field.name:
+                break
+
+            path.append(attr)
+            lookup = '__'.join([*filter(None, [prefix]), *path])
+
+            if model_field.many_to_one or model_field.one_to_one:
+                select.append(lookup)
+                current = model_field.related_model
+                continue
+
+            # Reverse FK / M2M: needs its own query, planned for the child.
+            prefetch.append(_plan_prefetch(lookup, model_field, field))
+            current = None
+
+        else:
+            # A nested serializer on a forward FK: plan its fields through the join.
+            if path and current is not None and isinstance(field, serializers.BaseSerializer):
+                nested_select, nested_prefetch = _collect(field, current, '__'.join([*filter(None, [prefix]), *path]))
+                select.extend(nested_select)
+                prefetch.extend(nested_prefetch)
+
+    return select, prefetch
+
+
+def _plan_prefetch(lookup, model_field, field):
+    if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+        related = model_field.related_model
+        # Django caches the parent on reverse-FK children, don't join it back.
+        skip = (model_field.field.name,) if model_field.one_to_many else ()
+        select, prefetch = _collect(field.child, related, skip=skip)
+        queryset = related._default_manager.all()
+        if hasattr(field, 'prefetch_queryset'):
+            queryset = field.prefetch_queryset(queryset)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return Prefetch(lookup, queryset=queryset)
+    return lookup
+
+
+class QueryPlanMixin:
+    """
+    Plans `get_queryset()` against the serializer the view is about to use.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return plan_queryset(queryset, self.get_serializer())
@@ -0,0 +1,64 @@
+import hashlib
+from dataclasses import dataclass, field
+
+import markdown
+import nh3
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+MARKDOWN_EXTENSIONS = ['extra', 'toc', 'sane_lists']
+EXCERPT_WORDS = 40
+
+# What survives sanitizing. Tags are nh3's defaults (no script, style,
+# iframe, form...); attributes are what the markdown extensions emit:
+# heading/footnote ids for the TOC, code block classes, table alignment.
+ALLOWED_ATTRIBUTES = {
+    '*': {'id', 'class', 'title'},
+    'a': {'href'},
+    'img': {'src', 'alt'},
+    'th': {'style'},
+    'td': {'style'},
+}
+ALLOWED_STYLES = {'text-align'}
+
+
+@dataclass
+class RenderedMarkdown:
+    html: str
+    toc: list = field(default_factory=list)
+    excerpt: str = ''
+
+
+def markdown_digest(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def _toc_entries(tokens):
+    return [
+        {'id': token['id'], 'title': token['name'], 'level': token['level'], 'children': _toc_entries(token['children'])}
+        for token in tokens
+    ]
+
+
+def plain_text(text):
+    html = markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS)
+    return ' '.join(strip_tags(html).split())
+
+
+def sanitize(html):
+    """
+    Allowlist-clean HTML: authors can write raw HTML and attribute lists in
+    their markdown, and the result is served as-is.
+    """
+    return nh3.clean(html, attributes=ALLOWED_ATTRIBUTES, filter_style_properties=ALLOWED_STYLES)
+
+
+def render_markdown(text):
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    html = sanitize(md.convert(text or ''))
+    plain = ' '.join(strip_tags(html).split())
+    return RenderedMarkdown(
+        html=html,
+        toc=_toc_entries(md.toc_tokens),
+        excerpt=Truncator(plain).words(EXCERPT_WORDS),
+    )
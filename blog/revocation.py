@@ -0,0 +1,92 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership with no false negatives. `capacity` entries fit
+    at roughly `error_rate` false positives; the bit array never grows.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class Denylist:
+    """
+    Revoked refresh-token jtis. The RevokedToken table is the source of
+    truth; each process keeps a Bloom filter of it so the usual answer
+    ("not revoked") costs no query. Filter hits are confirmed against the
+    table. Revocations from other processes are picked up every
+    TOKEN_DENYLIST_SYNC_INTERVAL seconds, and the filter is rebuilt (dropping
+    expired jtis) every TOKEN_DENYLIST_REBUILD_INTERVAL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._synced_at = self._rebuilt_at = 0.0
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._filter is not None and now - self._synced_at < settings.TOKEN_DENYLIST_SYNC_INTERVAL:
+            return
+        with self._lock:
+            if self._filter is None or now - self._rebuilt_at >= settings.TOKEN_DENYLIST_REBUILD_INTERVAL:
+                self._rebuild()
+                self._rebuilt_at = now
+            else:
+                for pk, jti in RevokedToken.objects.filter(pk__gt=self._last_id).values_list('pk', 'jti'):
+                    self._filter.add(jti)
+                    self._last_id = max(self._last_id, pk)
+            self._synced_at = now
+
+    def _rebuild(self):
+        RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        bloom = BloomFilter(settings.TOKEN_DENYLIST_CAPACITY, settings.TOKEN_DENYLIST_ERROR_RATE)
+        self._last_id = 0
+        for pk, jti in RevokedToken.objects.values_list('pk', 'jti').iterator():
+            bloom.add(jti)
+            self._last_id = max(self._last_id, pk)
+        self._filter = bloom
+
+
+denylist = Denylist()
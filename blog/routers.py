@@ -0,0 +1,111 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Reads inside this block go to a replica (if any are configured).
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def is_pinned(request):
+    # the client wrote something a moment ago; replicas may not have it yet
+    return settings.REPLICA_PIN_COOKIE in request.COOKIES
+
+
+def _is_primary(alias):
+    # a "replica" that is the primary's own database (under the test runner
+    # it's TEST['MIRROR']'d onto it) would only add a second connection
+    if alias not in connections:
+        return False
+    return connections[alias].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+
+
+def _replicas():
+    return [alias for alias in settings.REPLICA_DATABASES if not _is_primary(alias)]
+
+
+def reading_from_replica():
+    """
+    Whether reads made here go to a replica (and may lag the primary).
+    """
+    return _replica_reads.get() and bool(_replicas())
+
+
+class ReplicaRouter:
+    """
+    Writes always go to `default`. Reads go to a random replica from
+    settings.REPLICA_DATABASES, but only inside replica_reads() (i.e. the
+    safe-method requests of views using ReplicaReadMixin); everything else,
+    admin and auth included, reads from `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            replicas = _replicas()
+            if replicas:
+                return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # explicit, or Django would save a row back to the replica it was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Serve GET/HEAD/OPTIONS from a replica unless the client is pinned to
+    the primary by a recent write (see replica_pin_middleware).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS and not is_pinned(request):
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+@sync_and_async_middleware
+def replica_pin_middleware(get_response):
+    """
+    After any write, pin the client to the primary for REPLICA_PIN_SECONDS
+    so it reads its own writes while the replicas catch up.
+    """
+
+    def pin(request, response):
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return pin(request, await get_response(request))
+    else:
+        def middleware(request):
+            return pin(request, get_response(request))
+    return middleware
@@ -0,0 +1,126 @@
+"""
+One S3 client per process, shared by the storages and every ad hoc caller.
+
+boto3 clients are thread-safe and own the HTTP connection pool, so sharing
+one keeps TLS connections warm and pays credential resolution and the
+service-model load once. It is created on first use, not at startup.
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_lock = threading.Lock()
+_session = None
+_client = None
+_resource_class = None
+_local = threading.local()
+
+
+def _setting(name, default):
+    try:
+        return getattr(settings, name, default)
+    except ImproperlyConfigured:  # standalone scripts (boto-script.py)
+        return default
+
+
+def s3_config(**overrides):
+    """
+    Pool, keep-alive, retry and timeout tuning for S3 / Spaces.
+    """
+    options = {
+        'max_pool_connections': _setting('AWS_S3_MAX_POOL_CONNECTIONS', 32),
+        'connect_timeout': _setting('AWS_S3_CONNECT_TIMEOUT', 5),
+        'read_timeout': _setting('AWS_S3_READ_TIMEOUT', 30),
+        'retries': {'max_attempts': _setting('AWS_S3_MAX_ATTEMPTS', 5), 'mode': 'standard'},
+        'tcp_keepalive': True,
+        's3': {'addressing_style': _setting('AWS_S3_ADDRESSING_STYLE', None)},
+        'signature_version': _setting('AWS_S3_SIGNATURE_VERSION', None),
+    }
+    options.update(overrides)
+    return Config(**options)
+
+
+def make_client(endpoint_url=None, access_key=None, secret_key=None, region_name=None, session=None, **config):
+    """
+    A tuned S3 client from explicit settings (for scripts that run without
+    Django); inside the project use get_client().
+    """
+    session = session or boto3.session.Session()
+    return session.client(
+        's3',
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region_name,
+        config=s3_config(**config),
+    )
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=getattr(settings, 'AWS_S3_REGION_NAME', None),
+        )
+    return _session
+
+
+def get_client():
+    """
+    The process-wide S3 client, built from settings on first use.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = make_client(endpoint_url=settings.AWS_S3_ENDPOINT_URL, session=_get_session())
+    return _client
+
+
+def _get_resource_class():
+    global _resource_class
+    if _resource_class is None:
+        with _lock:
+            if _resource_class is None:
+                # generated from the service model; the client this builds is
+                # thrown away once per process, instances use the shared one
+                _resource_class = type(_get_session().resource('s3', endpoint_url=settings.AWS_S3_ENDPOINT_URL))
+    return _resource_class
+
+
+def get_resource():
+    """
+    A boto3 resource for this thread (resources aren't thread-safe) that sends
+    its requests through the shared client. Only the first one in the process
+    builds the resource class; the rest are plain instances of it.
+    """
+    client = get_client()
+    resource = getattr(_local, 'resource', None)
+    if resource is None or resource.meta.client is not client:
+        resource = _local.resource = _get_resource_class()(client=client)
+    return resource
+
+
+def reset():
+    """
+    Drop the shared client (tests, or after changing credentials).
+    """
+    global _session, _client
+    with _lock:
+        _session = _client = None
+
+
+class SharedClientStorageMixin:
+    """
+    For S3Boto3Storage subclasses: use the shared client instead of a new
+    session and connection pool per storage per thread.
+    """
+
+    @property
+    def connection(self):
+        return get_resource()
@@ -0,0 +1,138 @@
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .rendering import plain_text
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+
+@dataclass
+class SearchHit:
+    post_id: int
+    rank: float
+    snippet: str
+
+
+def search_document(post):
+    tags = ' '.join(tag.name for tag in post.tags.all())
+    return post.title, plain_text(post.markdown), tags
+
+
+class SQLiteFTSBackend:
+    """
+    SQLite FTS5 virtual table `blog_post_fts` (created by migration 0013),
+    rowid = post id. Ranked with bm25, title and tags weighted over the body.
+    """
+    table = 'blog_post_fts'
+
+    def index(self, post):
+        title, body, tags = search_document(post)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk])
+            cursor.execute(f'INSERT INTO {self.table} (rowid, title, body, tags) VALUES (%s, %s, %s, %s)', [post.pk, title, body, tags])
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    @staticmethod
+    def to_match(query):
+        # Quote every term so user input can't inject FTS5 syntax; the last
+        # term is a prefix match for search-as-you-type.
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, query, limit=20, offset=0):
+        match = self.to_match(query)
+        if match is None:
+            return []
+        sql = f'''
+            SELECT f.rowid, bm25({self.table}, 10.0, 1.0, 5.0) AS score,
+                   snippet({self.table}, 1, %s, %s, '…', 24)
+            FROM {self.table} f
+            JOIN blog_post p ON p.id = f.rowid
+            WHERE {self.table} MATCH %s AND p.published
+            ORDER BY score
+            LIMIT %s OFFSET %s
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [HIGHLIGHT_START, HIGHLIGHT_END, match, limit, offset])
+            # bm25 is "lower is better", flip it so rank reads naturally
+            return [SearchHit(post_id, -score, snippet) for post_id, score, snippet in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    """
+    Postgres `tsvector` index in `blog_post_search` (created by migration
+    0013), GIN indexed, ranked with ts_rank and highlighted with ts_headline.
+    """
+    table = 'blog_post_search'
+    config = 'english'
+
+    def index(self, post):
+        title, body, tags = search_document(post)
+        sql = f'''
+            INSERT INTO {self.table} (post_id, title, body, document)
+            VALUES (%s, %s, %s,
+                setweight(to_tsvector(%s, %s), 'A') ||
+                setweight(to_tsvector(%s, %s), 'B') ||
+                setweight(to_tsvector(%s, %s), 'C'))
+            ON CONFLICT (post_id) DO UPDATE
+            SET title = EXCLUDED.title, body = EXCLUDED.body, document = EXCLUDED.document
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [post.pk, title, body, self.config, title, self.config, tags, self.config, body])
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE post_id = %s', [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def search(self, query, limit=20, offset=0):
+        if not query.strip():
+            return []
+        sql = f'''
+            SELECT s.post_id, ts_rank(s.document, q) AS score,
+                   ts_headline(%s, s.body, q, %s)
+            FROM {self.table} s
+            JOIN blog_post p ON p.id = s.post_id,
+                 websearch_to_tsquery(%s, %s) q
+            WHERE s.document @@ q AND p.published
+            ORDER BY score DESC
+            LIMIT %s OFFSET %s
+        '''
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=35, MinWords=15'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.config, options, self.config, query, limit, offset])
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    path = getattr(settings, 'BLOG_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    backend = BACKENDS.get(connection.vendor)
+    # no search index on other databases
+    return backend() if backend else None
@@ -1,42 +1,141 @@
+from django.conf import settings
 from rest_framework import serializers
+from .derivatives import srcset
+from .instrumentation import TimedSerializerMixin
 from .models import Post, PostImage, Category, Tag, Comment
+from .tags import resolve_tags
 
-class CategorySerializer(serializers.ModelSerializer):
+
+def _split_param(request, name):
+    if request is None:
+        return None
+    raw = request.query_params.get(name)
+    if raw is None:
+        return None
+    return {part.strip() for part in raw.split(',') if part.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Lets the client pick the fields it needs:
+
+      ?fields=title,slug,tags.name  keep only these fields (dotted for nested)
+      ?expand=comments              include fields from Meta.expandable_fields,
+                                    which are left out unless asked for
+    """
+
+    def _field_path(self):
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(path))
+
+    def _selected(self, name):
+        selectors = _split_param(self.context.get('request'), name)
+        if selectors is None:
+            return None
+        prefix = self._field_path()
+        if prefix:
+            prefix += '.'
+        level = {s[len(prefix):].split('.')[0] for s in selectors if s.startswith(prefix) and len(s) > len(prefix)}
+        return level or None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        wanted = self._selected('fields')
+        expanded = self._selected('expand') or set()
+
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expanded and not (wanted and name in wanted):
+                fields.pop(name, None)
+        if wanted:
+            for name in list(fields):
+                if name not in wanted:
+                    fields.pop(name)
+        return fields
+
+
+class CategorySerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class CommentSerializer(serializers.ModelSerializer):
-    post = serializers.ReadOnlyField(source='post.id')
+class CommentSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    post = serializers.ReadOnlyField(source='post_id')
     
     class Meta:
         model = Comment
-        fields = '__all__'
+        exclude = ['thread', 'path']
+        read_only_fields = ['approved', 'depth']
+
+    def validate_parent(self, parent):
+        if parent is not None and parent.depth + 1 >= settings.COMMENT_MAX_DEPTH:
+            raise serializers.ValidationError(f'Replies can nest at most {settings.COMMENT_MAX_DEPTH - 1} levels deep.')
+        return parent
+
+
+class ApprovedCommentListSerializer(serializers.ListSerializer):
+    """
+    Comments embedded in public post payloads: approved only.
+    """
+
+    def prefetch_queryset(self, queryset):
+        # picked up by blog.queries when planning the Prefetch
+        return queryset.filter(approved=True).order_by('created_at', 'id')
+
+    def to_representation(self, data):
+        comments = data.all() if hasattr(data, 'all') else data
+        return super().to_representation([comment for comment in comments if comment.approved])
 
 
-class PostImageSerializer(serializers.ModelSerializer):
+class CommentModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+
+
+class PostImageSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = PostImage
-        fields = ['id', 'image', 'uploaded_at']
+        fields = ['id', 'image', 'srcset', 'uploaded_at']
+
+    def get_srcset(self, obj):
+        return srcset(obj.image.storage, obj.variants)
         
 
-class PostSerializer(serializers.ModelSerializer):
+class ImageUploadRequestSerializer(serializers.Serializer):
+    post = serializers.PrimaryKeyRelatedField(queryset=Post.objects.all())
+    filename = serializers.CharField(max_length=200)
+    content_type = serializers.CharField(max_length=100)
+
+
+class ImageUploadFinalizeSerializer(serializers.Serializer):
+    upload_id = serializers.IntegerField()
+
+
+class PostSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
     category = CategorySerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = ApprovedCommentListSerializer(child=CommentSerializer(), read_only=True)
     images = PostImageSerializer(many=True, read_only=True)
+    featured_image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = '__all__'
+        exclude = ['rendered_hash', 'featured_image_variants', 'changed_at']
+
+    def get_featured_image_srcset(self, obj):
+        return srcset(obj.featured_image.storage, obj.featured_image_variants)
 
     def update(self, instance, validated_data):
         featured_image = self.context['request'].FILES.get('featured_image')
@@ -46,7 +145,7 @@ class PostSerializer(serializers.ModelSerializer):
         # Optional: handle manual M2M updates here if needed
         tags_data = self.context['request'].data.getlist('tags')
         if tags_data:
-            instance.tags.set(tags_data)
+            instance.tags.set(resolve_tags(tags_data))
 
         # Update the rest of the fields using validated_data
         for attr, value in validated_data.items():
@@ -56,3 +155,22 @@ class PostSerializer(serializers.ModelSerializer):
         return instance
 
 
+class PostListSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Slim representation for post listings: no markdown body, no comments.
+    """
+    tags = serializers.SlugRelatedField(many=True, read_only=True, slug_field='name')
+    author = serializers.ReadOnlyField(source='author.username')
+    category = CategorySerializer(read_only=True)
+    featured_image_srcset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = [
+            'id', 'title', 'slug', 'excerpt', 'featured_image', 'featured_image_srcset', 'tags', 'created_at',
+            'approved_comment_count', 'image_count', 'author', 'category',
+        ]
+        expandable_fields = ['author', 'category']
+
+    def get_featured_image_srcset(self, obj):
+        return srcset(obj.featured_image.storage, obj.featured_image_variants)
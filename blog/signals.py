@@ -0,0 +1,187 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_tags
+from .counters import adjust_category, adjust_post, adjust_tags, is_deferred
+from .derivatives import schedule as schedule_derivatives
+from .models import Category, Comment, Post, PostImage, Tag
+from .search import get_search_backend
+
+
+def touch_posts(**filters):
+    # Bump changed_at (the conditional GET validator) without firing post_save;
+    # updated_at is left for real edits.
+    Post.objects.filter(**filters).update(changed_at=timezone.now())
+
+
+def reindex_posts(**filters):
+    backend = get_search_backend()
+    if backend is not None:
+        for post in Post.objects.filter(**filters):
+            backend.index(post)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    invalidate_tags('posts', f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    backend = get_search_backend()
+    if backend is not None and not raw:
+        backend.index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    backend = get_search_backend()
+    if backend is not None:
+        backend.remove(instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # tag.post_set.clear(): pk_set will be None, so look the posts up first
+        instance._cleared_post_ids = list(Post.objects.filter(tags=instance).values_list('pk', flat=True))
+        return
+    if not action.startswith('post_'):
+        return
+    if reverse and action == 'post_clear':
+        post_ids = instance.__dict__.pop('_cleared_post_ids', [])
+    else:
+        post_ids = pk_set if reverse else [instance.pk]
+    touch_posts(pk__in=post_ids)
+    invalidate_tags('posts', *(f'post:{pk}' for pk in post_ids))
+    reindex_posts(pk__in=post_ids)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=PostImage)
+def invalidate_post_children(sender, instance, **kwargs):
+    if is_deferred():
+        return
+    touch_posts(pk=instance.post_id)
+    invalidate_tags(f'post:{instance.post_id}')
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+def touch_tagged_posts(sender, instance, **kwargs):
+    touch_posts(tags=instance)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_tagged_posts(sender, instance, created, **kwargs):
+    if not created:
+        reindex_posts(tags=instance)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    invalidate_tags('tags')
+
+
+@receiver([post_save, pre_delete], sender=Category)
+def touch_category_posts(sender, instance, **kwargs):
+    touch_posts(category=instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate_tags('categories')
+
+
+@receiver(post_save, sender=Post)
+def queue_featured_image_derivatives(sender, instance, **kwargs):
+    if instance.featured_image and instance.featured_image_variants.get('source') != instance.featured_image.name:
+        schedule_derivatives(instance, 'featured_image', 'featured_image_variants')
+
+
+@receiver(post_save, sender=PostImage)
+def queue_post_image_derivatives(sender, instance, created, **kwargs):
+    if created:
+        schedule_derivatives(instance, 'image', 'variants')
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if raw or is_deferred():
+        return
+    was_approved = False if created else bool(instance.loaded_value('approved'))
+    adjust_post(
+        instance.post_id,
+        comment_count=1 if created else 0,
+        approved_comment_count=int(instance.approved) - int(was_approved),
+    )
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if is_deferred():
+        return
+    adjust_post(instance.post_id, comment_count=-1, approved_comment_count=-1 if instance.approved else 0)
+
+
+@receiver(post_save, sender=PostImage)
+def count_saved_image(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_post(instance.post_id, image_count=1)
+
+
+@receiver(post_delete, sender=PostImage)
+def count_deleted_image(sender, instance, **kwargs):
+    adjust_post(instance.post_id, image_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_published = False if created else bool(instance.loaded_value('published'))
+    old_category = None if created else instance.loaded_value('category_id')
+
+    if (was_published, old_category) != (instance.published, instance.category_id):
+        if was_published:
+            adjust_category(old_category, -1)
+        if instance.published:
+            adjust_category(instance.category_id, 1)
+        if not created and was_published != instance.published:
+            adjust_tags(instance.tags.values_list('pk', flat=True), 1 if instance.published else -1)
+    instance.remember_loaded_values()
+
+
+@receiver(pre_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    if instance.published:
+        adjust_category(instance.category_id, -1)
+        adjust_tags(instance.tags.values_list('pk', flat=True), -1)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def count_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # remove() reports the ids it was given, not the links that existed
+        links = Post.tags.through.objects.filter(**{'tag' if reverse else 'post': instance})
+        if pk_set is not None:
+            links = links.filter(**{'post_id__in' if reverse else 'tag_id__in': pk_set})
+        if reverse:
+            links = links.filter(post__published=True)
+        instance._removed_tag_links = list(links.values_list('post_id' if reverse else 'tag_id', flat=True))
+        return
+
+    if action in ('post_remove', 'post_clear'):
+        ids, delta = instance.__dict__.pop('_removed_tag_links', []), -1
+    elif action == 'post_add':
+        ids, delta = pk_set, 1
+        if reverse:
+            ids = list(Post.objects.filter(pk__in=pk_set, published=True).values_list('pk', flat=True))
+    else:
+        return
+
+    if reverse:
+        adjust_tags([instance.pk], delta * len(ids))
+    elif instance.published:
+        adjust_tags(ids, delta)
@@ -0,0 +1,47 @@
+from django.db.models import Q
+from django.utils.text import slugify
+
+from .cache import invalidate_tags
+from .models import Tag
+
+
+def normalize_tag_names(names):
+    """
+    Strip and collapse whitespace, drop blanks and names that don't slugify,
+    and dedupe on slug (first spelling wins). Returns {slug: name} in order.
+    """
+    normalized = {}
+    for name in names:
+        name = ' '.join(str(name).split())
+        slug = slugify(name)
+        if slug and slug not in normalized:
+            normalized[slug] = name
+    return normalized
+
+
+def resolve_tags(names):
+    """
+    Map tag names to Tag rows: one query for the existing ones, one
+    bulk_create for the rest (+ one re-read). Concurrent creators of the same
+    tag are fine, the loser's insert is ignored and the re-read picks the row up.
+    """
+    wanted = normalize_tag_names(names)
+    if not wanted:
+        return []
+
+    def lookup():
+        found = {}
+        for tag in Tag.objects.filter(Q(slug__in=wanted.keys()) | Q(name__in=wanted.values())):
+            found[tag.slug] = tag
+            found.setdefault(slugify(tag.name), tag)
+        return found
+
+    found = lookup()
+    missing = [Tag(name=name, slug=slug) for slug, name in wanted.items() if slug not in found]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        # bulk_create skips post_save
+        invalidate_tags('tags')
+        found = lookup()
+
+    return [found[slug] for slug in wanted if slug in found]
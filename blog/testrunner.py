@@ -0,0 +1,26 @@
+import logging.config
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+from .logconfig import build_logging
+
+
+class TestRunner(DiscoverRunner):
+    """
+    The default runner, with the log written to a temp dir for the run
+    instead of DJANGO_LOG_FILE.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.log_dir = tempfile.TemporaryDirectory(prefix='blog-tests-')
+        settings.LOGGING = build_logging(Path(self.log_dir.name) / 'tests.log', profile=settings.LOG_PROFILE)
+        logging.config.dictConfig(settings.LOGGING)
+
+    def teardown_test_environment(self, **kwargs):
+        logging.shutdown()
+        self.log_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
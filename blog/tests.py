@@ -1,3 +1,1410 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+import boto3
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from BlogBackend.storage_backends import MediaStorage, StaticStorage
+from .models import Category, Comment, PendingImageUpload, Post, PostImage, RevokedToken, Tag
+from .auth import token_user
+from .cache import tag_versions
+from .derivatives import available_formats
+from .instrumentation import InstrumentedStorageMixin
+from .logconfig import PROFILES, BackgroundFileHandler, RateLimitFilter, build_logging
+from .mediacache import CachedStorageMixin, TTLCache
+from .mediasync import MediaSync
+from .revocation import BloomFilter, denylist
+from .routers import ReplicaRouter, replica_reads
+from . import s3
+from .tags import resolve_tags
+from .uploads import _stored_object, used_image_slots
+
+
+def make_posts(author, count, start=0):
+    category, _ = Category.objects.get_or_create(name='General')
+    tags = [Tag.objects.get_or_create(name=name)[0] for name in ('django', 'python')]
+    for i in range(start, start + count):
+        post = Post.objects.create(author=author, title=f'Post {i}', markdown='# Hello', category=category, published=True)
+        post.tags.set(tags)
+        Comment.objects.create(post=post, name='Reader', email='reader@example.com', body='Nice', approved=True)
+        PostImage.objects.create(post=post, image=f'post_images/{i}.jpg')
+
+
+class PostQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+
+    def test_post_list_query_count_is_constant(self):
+        # validator aggregate + posts + tags
+        make_posts(self.author, 1)
+        with self.assertNumQueries(3):
+            self.client.get('/api/posts/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_posts(self.author, 9, start=1)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_post_detail_query_count(self):
+        make_posts(self.author, 1)
+        post = Post.objects.get()
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/posts/{post.pk}/')
+        self.assertEqual(response.data['author'], 'writer')
+        self.assertEqual(len(response.data['tags']), 2)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        make_posts(self.author, 5)
+
+    def test_post_list_walks_cursor_pages(self):
+        seen = []
+        url = '/api/posts/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(post['id'] for post in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_nested_comments_are_paginated_per_post(self):
+        post = Post.objects.first()
+        response = self.client.get(f'/api/posts/{post.pk}/comments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['post'] for c in response.data['results']], [post.pk])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        make_posts(self.author, 2)
+        self.post = Post.objects.first()
+
+    def test_list_uses_slim_serializer(self):
+        post = self.client.get('/api/posts/').data['results'][0]
+        self.assertEqual(set(post), {
+            'id', 'title', 'slug', 'excerpt', 'featured_image', 'featured_image_srcset', 'tags', 'created_at',
+            'approved_comment_count', 'image_count',
+        })
+        self.assertEqual(post['tags'], ['django', 'python'])
+
+    def test_expand_adds_expandable_fields(self):
+        post = self.client.get('/api/posts/?expand=author,category').data['results'][0]
+        self.assertEqual(post['author'], 'writer')
+        self.assertEqual(post['category']['name'], 'General')
+
+    def test_fields_trims_detail_and_nested_serializers(self):
+        response = self.client.get(f'/api/posts/{self.post.pk}/?fields=title,tags.name')
+        self.assertEqual(set(response.data), {'title', 'tags'})
+        self.assertEqual(response.data['tags'], [{'name': 'django'}, {'name': 'python'}])
+
+    def test_fields_skips_unrequested_relations(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/posts/{self.post.pk}/?fields=title,slug')
+        self.assertEqual(set(response.data), {'title', 'slug'})
+
+
+class RenderedMarkdownTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        self.post = Post.objects.create(author=self.author, title='Hello', markdown='# Intro\n\nSome *text* here.', published=True)
+
+    def test_rendered_on_save_not_on_read(self):
+        self.assertNotEqual(self.post.rendered_hash, '')
+        with patch('blog.models.render_markdown') as render:
+            data = self.client.get(f'/api/posts/{self.post.pk}/').data
+            self.client.get('/api/posts/')
+        render.assert_not_called()
+        self.assertIn('<h1 id="intro">Intro</h1>', data['rendered_html'])
+        self.assertEqual(data['toc'][0]['id'], 'intro')
+        self.assertEqual(data['excerpt'], 'Intro Some text here.')
+        self.assertNotIn('rendered_hash', data)
+
+    def test_save_rerenders_only_when_markdown_changes(self):
+        with patch('blog.models.render_markdown') as render:
+            self.post.title = 'Renamed'
+            self.post.save()
+        render.assert_not_called()
+
+        self.post.markdown = '## Changed'
+        self.post.save(update_fields=['markdown'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.toc[0]['id'], 'changed')
+
+    def test_listing_does_not_write(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/posts/')
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+
+    def test_raw_html_is_sanitized(self):
+        self.post.markdown = (
+            '<script>alert(1)</script>\n\n[x](javascript:alert(1))\n\n'
+            'Hi <img src="a.png" onerror="alert(1)">\n{: onclick="alert(1)" }'
+        )
+        self.post.save()
+        html = self.post.rendered_html
+        for bad in ('<script', 'javascript:', 'onerror', 'onclick'):
+            self.assertNotIn(bad, html)
+        self.assertIn('<img src="a.png">', html)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        make_posts(self.author, 2)
+        self.post = Post.objects.first()
+        self.other = Post.objects.last()
+
+    def test_list_served_from_cache_until_a_post_changes(self):
+        self.assertEqual(self.client.get('/api/posts/')['X-Cache'], 'MISS')
+        # only the conditional GET validator query
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Changed'
+            self.post.save()
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Changed', [p['title'] for p in response.data['results']])
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/api/posts/')
+        self.assertEqual(self.client.get('/api/posts/?expand=author')['X-Cache'], 'MISS')
+
+    def test_comment_only_invalidates_its_post(self):
+        self.client.get(f'/api/posts/{self.post.pk}/')
+        self.client.get(f'/api/posts/{self.other.pk}/')
+        self.client.get('/api/posts/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, name='A', email='a@example.com', body='Hi')
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.pk}/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(f'/api/posts/{self.other.pk}/')['X-Cache'], 'HIT')
+        # listings only show the approved count, which a pending comment doesn't change
+        self.assertEqual(self.client.get('/api/posts/')['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, name='B', email='b@example.com', body='Hi', approved=True)
+        self.assertEqual(self.client.get('/api/posts/')['X-Cache'], 'MISS')
+
+    def test_tag_rename_invalidates_tags_and_posts(self):
+        self.client.get('/api/tags/')
+        self.client.get(f'/api/posts/{self.post.pk}/')
+        self.client.get('/api/categories/')
+
+        tag = Tag.objects.get(name='django')
+        tag.name = 'Django'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(self.client.get('/api/tags/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.pk}/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/categories/')['X-Cache'], 'HIT')
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=backend):
+                self.assertEqual(self.client.get('/api/categories/')['X-Cache'], 'MISS')
+                self.assertEqual(self.client.get('/api/categories/')['X-Cache'], 'HIT')
+                with self.captureOnCommitCallbacks(execute=True):
+                    Category.objects.create(name='News')
+                response = self.client.get('/api/categories/')
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(len(response.data), 2)
+
+    def test_responses_read_from_a_replica_expire_with_the_lag(self):
+        def cached_timeouts(client):
+            cache.clear()
+            with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+                self.assertEqual(client.get('/api/tags/')['X-Cache'], 'MISS')
+            return [c.args[2] for c in cache_set.call_args_list if c.args[0].startswith('rcache:e:')]
+
+        with patch('blog.cache.reading_from_replica', return_value=True):
+            self.assertEqual(cached_timeouts(APIClient()), [10])
+        self.assertEqual(cached_timeouts(APIClient()), [settings.RESPONSE_CACHE_TIMEOUT])
+
+    def test_versions_are_bumped_when_the_write_commits(self):
+        listing = tag_versions(['posts'])
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.post.title = 'Changed'
+                self.post.save()
+                # a reader now still sees the old row; it must cache it under the old version
+                self.assertEqual(tag_versions(['posts']), listing)
+        self.assertNotEqual(tag_versions(['posts']), listing)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        make_posts(self.author, 2)
+        self.post = Post.objects.first()
+        self.url = f'/api/posts/{self.post.pk}/'
+
+    def test_detail_answers_304_from_one_query(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_malformed_and_unknown_ids_are_404(self):
+        self.assertEqual(self.client.get('/api/posts/abc/').status_code, 404)
+        self.assertEqual(self.client.get('/api/posts/999999/').status_code, 404)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_changes_post_validator(self):
+        response = self.client.get(self.url)
+        etag, updated_at = response['ETag'], response.data['updated_at']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, name='A', email='a@example.com', body='Hi', approved=True)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        # the post itself wasn't edited
+        self.assertEqual(response.data['updated_at'], updated_at)
+        self.assertNotIn('changed_at', response.data)
+
+    def test_list_validator_tracks_deletes_and_params(self):
+        etag = self.client.get('/api/posts/')['ETag']
+        self.assertEqual(self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/posts/?expand=author', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        Post.objects.last().delete()
+        self.assertEqual(self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TagResolutionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+
+    def test_resolves_in_bulk(self):
+        Tag.objects.create(name='Django')
+        names = ['Django', '  machine   learning ', 'django', ''] + [f'tag {i}' for i in range(13)]
+        # existing lookup, bulk insert, re-read
+        with self.assertNumQueries(3):
+            tags = resolve_tags(names)
+        self.assertEqual([t.slug for t in tags][:2], ['django', 'machine-learning'])
+        self.assertEqual(len(tags), 15)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_tags(names), tags)
+
+    def test_create_and_update_attach_tags(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post('/api/posts/', {'title': 'Tagged', 'markdown': 'x', 'tags': ['AI', 'ML', 'ai']}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(title='Tagged')
+        self.assertEqual(sorted(post.tags.values_list('name', flat=True)), ['AI', 'ML'])
+
+        response = self.client.patch(f'/api/post/{post.pk}/update/', {'tags': ['ML', 'Python']}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(t['name'] for t in response.data['tags']), ['ML', 'Python'])
+
+
+class TempMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        storages = {'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': self.media.name}}}
+        self.settings_override = override_settings(STORAGES=storages)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        self.client.force_authenticate(self.author)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+        super().tearDown()
+
+    def images(self, count, content=b'jpeg-bytes'):
+        return [SimpleUploadedFile(f'photo{i}.jpg', content, content_type='image/jpeg') for i in range(count)]
+
+    def stored_files(self):
+        folder = os.path.join(self.media.name, 'post_images')
+        return os.listdir(folder) if os.path.isdir(folder) else []
+
+
+class ImageUploadTests(TempMediaMixin, TestCase):
+    def test_images_uploaded_and_saved_in_bulk(self):
+        response = self.client.post('/api/posts/', {'title': 'Gallery', 'markdown': 'x', 'images': self.images(5)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(title='Gallery')
+        names = list(post.images.order_by('id').values_list('image', flat=True))
+        self.assertEqual(len(names), 5)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+    def test_failed_upload_cleans_up(self):
+        real_save = default_storage.save
+
+        def flaky_save(name, content, max_length=None):
+            if content.name == 'photo3.jpg':
+                raise OSError('storage unavailable')
+            return real_save(name, content, max_length=max_length)
+
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(self.author)
+        with patch.object(default_storage, 'save', side_effect=flaky_save):
+            response = client.post('/api/post/create/', {'title': 'Gallery', 'markdown': 'x', 'images': self.images(5)}, format='multipart')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(PostImage.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_failed_save_discards_uploads(self):
+        with patch('blog.views.resolve_tags', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/posts/', {'title': 'Gallery', 'markdown': 'x', 'images': self.images(3)}, format='multipart')
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+
+class OverwritingFileSystemStorage(FileSystemStorage):
+    """
+    Saves over an existing file like S3Boto3Storage does, slowly enough for
+    concurrent saves to race.
+    """
+
+    def _save(self, name, content):
+        time.sleep(0.05)
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            for chunk in content.chunks():
+                f.write(chunk)
+        return name
+
+
+class CachedOverwritingFileSystemStorage(CachedStorageMixin, OverwritingFileSystemStorage):
+    pass
+
+
+class DuplicateUploadNameTests(TempMediaMixin, TestCase):
+    def upload_twice(self, backend):
+        self.settings_override.disable()
+        storages = {'default': {'BACKEND': backend, 'OPTIONS': {'location': self.media.name}}}
+        self.settings_override = override_settings(STORAGES=storages)
+        self.settings_override.enable()
+
+        files = [SimpleUploadedFile('photo.jpg', content, content_type='image/jpeg') for content in (b'one', b'two')]
+        response = self.client.post('/api/posts/', {'title': 'Twins', 'markdown': 'x', 'images': files}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        names = list(PostImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(set(names)), 2)
+        self.assertEqual(sorted(default_storage.open(name).read() for name in names), [b'one', b'two'])
+
+    def test_same_filename_twice_in_one_request(self):
+        self.upload_twice('blog.tests.OverwritingFileSystemStorage')
+
+    def test_same_filename_twice_with_cached_storage(self):
+        self.upload_twice('blog.tests.CachedOverwritingFileSystemStorage')
+
+
+@override_settings(IMAGE_DERIVATIVES_SYNC=True, IMAGE_DERIVATIVE_WIDTHS=[320, 640, 4000])
+class ImageDerivativeTests(TempMediaMixin, TestCase):
+    def jpeg(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'teal').save(buffer, format='JPEG')
+        return buffer.getvalue()
+
+    def test_derivatives_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'title': 'Gallery', 'markdown': 'x', 'images': self.images(2, self.jpeg())}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+        image = PostImage.objects.first()
+        self.assertEqual(image.variants['source'], image.image.name)
+        for fmt in available_formats():
+            self.assertEqual([(v['width'], v['height']) for v in image.variants[fmt]], [(320, 213), (640, 427)])
+            self.assertTrue(all(default_storage.exists(v['name']) for v in image.variants[fmt]))
+
+        post = self.client.get(f'/api/posts/{image.post_id}/').data
+        self.assertIn('320w', post['images'][0]['srcset']['webp'])
+
+
+class PresignedUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(author=self.author, title='Gallery', markdown='x')
+        presign = patch('blog.uploads.presigned_post', return_value={'url': 'https://bucket.example.com', 'fields': {'key': 'k'}})
+        presign.start()
+        self.addCleanup(presign.stop)
+
+    def presign(self, **overrides):
+        data = {'post': self.post.pk, 'filename': 'photo.jpg', 'content_type': 'image/jpeg', **overrides}
+        return self.client.post('/api/images/presign/', data, format='json')
+
+    def test_presign_then_finalize(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['url'], 'https://bucket.example.com')
+
+        upload_id = response.data['upload_id']
+        self.assertEqual(self.client.post('/api/images/finalize/', {'upload_id': upload_id}).status_code, 400)
+
+        default_storage.save(response.data['name'], io.BytesIO(b'jpeg-bytes'))
+        response = self.client.post('/api/images/finalize/', {'upload_id': upload_id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.post.images.count(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(used_image_slots(self.post), 1)  # the image, not the finished upload too
+
+        # a retry gets the same image back
+        retry = self.client.post('/api/images/finalize/', {'upload_id': upload_id})
+        self.assertEqual(retry.data['id'], response.data['id'])
+        self.assertEqual(self.post.images.count(), 1)
+
+    def test_finalize_reads_object_metadata_once(self):
+        storage = MagicMock(spec=['bucket', '_normalize_name'])
+        storage.bucket.Object.return_value.content_length = 10
+        storage.bucket.Object.return_value.content_type = 'image/jpeg'
+        self.assertEqual(_stored_object(storage, 'post_images/a.jpg'), (10, 'image/jpeg'))
+        storage.bucket.Object.return_value.load.assert_called_once_with()
+
+    def test_slots_reserved_at_issuance(self):
+        for i in range(9):
+            PostImage.objects.create(post=self.post, image=f'post_images/{i}.jpg')
+        self.assertEqual(self.presign().status_code, 201)
+        response = self.presign()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PendingImageUpload.objects.count(), 1)
+
+    def test_expired_uploads_are_removed_from_the_bucket(self):
+        names = []
+        for _ in range(2):
+            response = self.presign()
+            default_storage.save(response.data['name'], io.BytesIO(b'jpeg-bytes'))
+            names.append((response.data['upload_id'], response.data['name']))
+        PendingImageUpload.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # finalized too late
+        (late_id, late_name), (abandoned_id, abandoned_name) = names
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/images/finalize/', {'upload_id': late_id}).status_code, 400)
+        self.assertFalse(default_storage.exists(late_name))
+        # never finalized: cleared by the next reservation
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.presign().status_code, 201)
+        self.assertFalse(default_storage.exists(abandoned_name))
+        self.assertFalse(PendingImageUpload.objects.filter(pk__in=[late_id, abandoned_id]).exists())
+
+    def test_rejects_other_authors_and_content_types(self):
+        self.assertEqual(self.presign(content_type='application/pdf').status_code, 400)
+        other = get_user_model().objects.create_user(username='other', password='pw')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.presign().status_code, 403)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        self.sqlite = Post.objects.create(author=self.author, title='Tuning SQLite', markdown='Enable **WAL** mode for concurrent readers.', published=True)
+        self.caching = Post.objects.create(author=self.author, title='Caching', markdown='Readers love a warm cache. SQLite is not involved.', published=True)
+        self.draft = Post.objects.create(author=self.author, title='SQLite draft', markdown='Unfinished', published=False)
+
+    def search(self, q):
+        response = self.client.get('/api/posts/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_ranked_results_with_snippets(self):
+        results = self.search('sqlite')
+        self.assertEqual([r['id'] for r in results], [self.sqlite.pk, self.caching.pk])
+        self.assertIn('<mark>SQLite</mark>', results[1]['snippet'])
+        self.assertNotIn(self.draft.pk, [r['id'] for r in results])
+
+    def test_prefix_match_and_syntax_is_escaped(self):
+        self.assertEqual([r['id'] for r in self.search('concur')], [self.sqlite.pk])
+        self.assertEqual(self.search('"NEAR( OR *'), [])
+
+    def test_index_follows_saves_tags_and_deletes(self):
+        self.caching.markdown = 'Now about Redis.'
+        self.caching.save()
+        self.assertEqual([r['id'] for r in self.search('sqlite')], [self.sqlite.pk])
+
+        self.caching.tags.add(Tag.objects.create(name='sqlite'))
+        self.assertEqual(len(self.search('sqlite')), 2)
+
+        self.sqlite.delete()
+        self.assertEqual([r['id'] for r in self.search('sqlite')], [self.caching.pk])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blog_post_fts')
+        self.assertEqual(self.search('sqlite'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.search('sqlite')), 2)
+
+
+class PostFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        self.other = get_user_model().objects.create_user(username='other', password='pw')
+        make_posts(self.author, 3)
+        self.news = Category.objects.create(name='News')
+        self.scoop = Post.objects.create(author=self.other, title='Scoop', category=self.news, published=True)
+        self.scoop.tags.add(Tag.objects.create(name='Breaking'))
+        self.draft = Post.objects.create(author=self.author, title='Draft', published=False)
+
+    def titles(self, query='', user=None):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'/api/posts/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [p['title'] for p in response.data['results']]
+
+    def test_drafts_only_visible_to_their_author(self):
+        self.assertNotIn('Draft', self.titles())
+        self.assertNotIn('Draft', self.titles(user=self.other))
+        self.assertEqual(self.titles('?published=false', user=self.author), ['Draft'])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(f'/api/posts/{self.draft.pk}/').status_code, 404)
+
+    def test_filters(self):
+        self.assertEqual(self.titles('?category=news'), ['Scoop'])
+        self.assertEqual(self.titles('?tag=breaking'), ['Scoop'])
+        self.assertEqual(self.titles('?author=other'), ['Scoop'])
+        self.assertEqual(len(self.titles('?category=general&tag=django')), 3)
+        self.assertEqual(self.titles('?created_before=2000-01-01'), [])
+        self.assertEqual(len(self.titles('?created_after=2000-01-01')), 4)
+        self.assertEqual(self.client.get('/api/posts/?created_after=yesterday').status_code, 400)
+
+    def test_ordering(self):
+        self.assertEqual(self.titles('?ordering=title'), ['Post 0', 'Post 1', 'Post 2', 'Scoop'])
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                if query['sql'].startswith('SELECT') and 'FROM "blog_post"' in query['sql']:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append(' | '.join(row[-1] for row in cursor.fetchall()))
+        return plans
+
+    def test_listing_queries_use_indexes(self):
+        for url, index in [
+            ('/api/posts/', 'post_published_created_idx'),
+            ('/api/posts/?published=true&created_after=2000-01-01', 'post_published_created_idx'),
+            ('/api/posts/?category=news', 'post_category_created_idx'),
+            ('/api/posts/?author=other', 'post_author_created_idx'),
+        ]:
+            plans = self.query_plans(url)
+            self.assertTrue(plans, url)
+            for plan in plans:
+                self.assertNotRegex(plan, r'SCAN blog_post(?! USING)', f'{url}: {plan}')
+            self.assertIn(index, plans[-1], url)
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', plans[-1], url)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        self.category = Category.objects.create(name='General')
+        self.tag = Tag.objects.create(name='django')
+        self.post = Post.objects.create(author=self.author, title='Counted', category=self.category, published=True)
+
+    def assertCounts(self, post=None, tag=None, category=None):
+        for obj, expected in ((self.post, post), (self.tag, tag), (self.category, category)):
+            if expected is None:
+                continue
+            obj.refresh_from_db()
+            fields = expected.keys() if isinstance(expected, dict) else ['post_count']
+            values = expected if isinstance(expected, dict) else {'post_count': expected}
+            self.assertEqual({f: getattr(obj, f) for f in fields}, values)
+
+    def test_pending_comments_leave_listings_cached(self):
+        listing = tag_versions(['posts'])
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(post=self.post, name='Spam', email='s@example.com', body='Buy now')
+        self.assertEqual(tag_versions(['posts']), listing)
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.approved = True
+            comment.save()
+        self.assertNotEqual(tag_versions(['posts']), listing)
+
+    def test_comment_and_image_counts(self):
+        comment = Comment.objects.create(post=self.post, name='A', email='a@example.com', body='Hi')
+        Comment.objects.create(post=self.post, name='B', email='b@example.com', body='Hi', approved=True)
+        PostImage.objects.create(post=self.post, image='post_images/a.jpg')
+        self.assertCounts(post={'comment_count': 2, 'approved_comment_count': 1, 'image_count': 1})
+
+        comment = Comment.objects.get(pk=comment.pk)
+        comment.approved = True
+        comment.save()
+        comment.save()
+        self.assertCounts(post={'approved_comment_count': 2})
+
+        comment.delete()
+        self.post.images.get().delete()
+        self.assertCounts(post={'comment_count': 1, 'approved_comment_count': 1, 'image_count': 0})
+
+    def test_tag_and_category_counts_follow_publishing(self):
+        self.post.tags.add(self.tag)
+        self.assertCounts(tag=1, category=1)
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.published = False
+        post.save()
+        self.assertCounts(tag=0, category=0)
+
+        draft = Post.objects.create(author=self.author, title='Draft', category=self.category)
+        draft.tags.add(self.tag)
+        self.assertCounts(tag=0, category=0)
+
+        post.published = True
+        post.save()
+        self.tag.post_set.remove(post, draft)
+        self.assertCounts(tag=0, category=1)
+
+        post.tags.add(self.tag)
+        post.delete()
+        self.assertCounts(tag=0, category=0)
+
+    def test_recount_repairs_drift(self):
+        self.post.tags.add(self.tag)
+        Comment.objects.create(post=self.post, name='A', email='a@example.com', body='Hi', approved=True)
+        Post.objects.update(comment_count=7, approved_comment_count=0)
+        Tag.objects.update(post_count=3)
+
+        out = io.StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('1 post rows, 1 tag rows, 0 category rows', out.getvalue())
+        self.assertCounts(post={'comment_count': 1, 'approved_comment_count': 1}, tag=1, category=1)
+
+
+class CommentModerationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.author = User.objects.create_user(username='writer', password='pw')
+        self.staff = User.objects.create_user(username='mod', password='pw', is_staff=True)
+        self.post = Post.objects.create(author=self.author, title='Moderated', published=True)
+        self.approved = Comment.objects.create(post=self.post, name='A', email='a@example.com', body='Fine', approved=True)
+        self.pending = [
+            Comment.objects.create(post=self.post, name=f'S{i}', email='s@example.com', body='Buy now')
+            for i in range(3)
+        ]
+        self.client = APIClient()
+
+    def test_public_reads_hide_unapproved(self):
+        response = self.client.get(f'/api/posts/{self.post.pk}/comments/')
+        self.assertEqual([c['id'] for c in response.data['results']], [self.approved.pk])
+
+        response = self.client.get(f'/api/posts/{self.post.pk}/')
+        self.assertEqual([c['id'] for c in response.data['comments']], [self.approved.pk])
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(f'/api/posts/{self.post.pk}/comments/')
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_new_comments_wait_for_approval(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(f'/api/posts/{self.post.pk}/comments/', {'name': 'N', 'email': 'n@example.com', 'body': 'Hi', 'approved': True}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Comment.objects.get(pk=response.data['id']).approved)
+
+    def test_moderation_queue_is_staff_only(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get('/api/comments/moderation/').status_code, 403)
+        self.assertEqual(self.client.post('/api/comments/approve/', {'ids': [self.pending[0].pk]}, format='json').status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/comments/moderation/')
+        self.assertEqual([c['id'] for c in response.data['results']], [c.pk for c in self.pending])
+
+    def test_bulk_approve_and_reject(self):
+        self.client.force_authenticate(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/comments/approve/', {'ids': [self.pending[0].pk, self.approved.pk]}, format='json')
+        self.assertEqual(response.data, {'approved': 1})
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "blog_comment"') for q in ctx.captured_queries), 1)
+
+        response = self.client.post('/api/comments/reject/', {'ids': [c.pk for c in self.pending[1:]]}, format='json')
+        self.assertEqual(response.data, {'rejected': 2})
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.approved_comment_count), (2, 2))
+        self.assertFalse(Comment.objects.filter(approved=False).exists())
+
+
+@override_settings(COMMENT_MAX_DEPTH=3)
+class ThreadedCommentTests(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        self.post = Post.objects.create(author=self.author, title='Threads', published=True)
+        self.client = APIClient()
+
+    def comment(self, parent=None, approved=True, **kwargs):
+        return Comment.objects.create(post=self.post, parent=parent, name='A', email='a@example.com', body='Hi', approved=approved, **kwargs)
+
+    def test_tree_in_constant_queries(self):
+        first, second = self.comment(), self.comment()
+        reply = self.comment(first)
+        nested = self.comment(reply)
+        hidden = self.comment(second, approved=False)
+        self.comment(hidden)
+        self.assertEqual((nested.thread_id, nested.depth), (first.pk, 2))
+        self.assertTrue(nested.path.startswith(reply.path))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/posts/{self.post.pk}/comments/')
+        self.assertEqual(len(ctx.captured_queries), 2)
+        tree = response.data['results']
+        self.assertEqual([c['id'] for c in tree], [first.pk, second.pk])
+        self.assertEqual(tree[0]['replies'][0]['id'], reply.pk)
+        self.assertEqual(tree[0]['replies'][0]['replies'][0]['id'], nested.pk)
+        self.assertEqual(tree[1]['replies'], [])
+
+        response = self.client.get(f'/api/posts/{self.post.pk}/comments/?depth=1')
+        self.assertEqual(response.data['results'][0]['replies'][0]['replies'], [])
+
+    def test_top_level_cursor_pagination(self):
+        roots = [self.comment() for _ in range(3)]
+        self.comment(roots[2])
+        response = self.client.get(f'/api/posts/{self.post.pk}/comments/?page_size=2')
+        self.assertEqual([c['id'] for c in response.data['results']], [c.pk for c in roots[:2]])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results'][0]['replies']), 1)
+
+    def test_reply_validation(self):
+        root = self.comment()
+        deepest = self.comment(self.comment(root))
+        other = Post.objects.create(author=self.author, title='Other', published=True)
+        self.client.force_authenticate(self.author)
+        url = f'/api/posts/{self.post.pk}/comments/'
+        payload = {'name': 'B', 'email': 'b@example.com', 'body': 'Re'}
+
+        self.assertEqual(self.client.post(url, {**payload, 'parent': root.pk}, format='json').status_code, 201)
+        self.assertEqual(self.client.post(url, {**payload, 'parent': deepest.pk}, format='json').status_code, 400)
+        response = self.client.post(f'/api/posts/{other.pk}/comments/', {**payload, 'parent': root.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejecting_a_comment_counts_its_replies(self):
+        root = self.comment()
+        self.comment(self.comment(root))
+        staff = get_user_model().objects.create_user(username='mod', password='pw', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.post('/api/comments/reject/', {'ids': [root.pk]}, format='json')
+        self.assertEqual(response.data, {'rejected': 3})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.approved_comment_count), (0, 0))
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(username='writer', password='pw', email='w@example.com')
+        make_posts(self.author, 3)
+        self.client = APIClient()
+        response = self.client.post('/api/token/', {'username': 'writer', 'password': 'pw'}, format='json')
+        self.access = response.data['access']
+
+    def test_reads_skip_the_user_lookup(self):
+        with CaptureQueriesContext(connection) as anonymous:
+            self.client.get('/api/posts/?page_size=3')
+        cache.clear()
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/posts/?page_size=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), len(anonymous.captured_queries))
+        self.assertFalse(any('users_customuser' in q['sql'] and 'blog_post' not in q['sql'] for q in ctx.captured_queries))
+
+    def test_cookie_fallback_and_lazy_fields(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.client.cookies['access_token'] = self.access
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/me/')
+        self.assertEqual(response.data, {'id': self.author.pk, 'username': 'writer', 'email': 'w@example.com'})
+        # only `email` isn't in the token
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        self.client.cookies['access_token'] = 'garbage'
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+
+    def test_token_user_works_for_ownership_and_writes(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        post = Post.objects.filter(author=self.author).first()
+        response = self.client.patch(f'/api/posts/{post.pk}/', {'title': 'Renamed'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/api/posts/', {'title': 'Fresh', 'markdown': 'x'}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Post.objects.get(title='Fresh').author, self.author)
+
+
+class RefreshRotationTests(TestCase):
+    def setUp(self):
+        denylist.reset()
+        get_user_model().objects.create_user(username='writer', password='pw')
+        self.client = APIClient()
+        self.refresh = self.client.post('/api/token/', {'username': 'writer', 'password': 'pw'}, format='json').data['refresh']
+
+    def test_refresh_rotates_and_old_token_is_revoked(self):
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        rotated = response.data['refresh']
+        self.assertNotEqual(rotated, self.refresh)
+
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': rotated}, format='json').status_code, 200)
+
+    def refreshed(self, refresh):
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return AccessToken(response.data['access']), RefreshToken(response.data['refresh'])
+
+    def test_refresh_rewrites_claims_from_the_user(self):
+        user = get_user_model().objects.get(username='writer')
+        user.is_staff = True
+        user.save()
+        access, refresh = self.refreshed(self.refresh)
+        self.assertTrue(access['is_staff'])
+
+        user.is_staff = False
+        user.save()
+        access, refresh = self.refreshed(refresh)
+        self.assertFalse(access['is_staff'])
+        self.assertFalse(refresh['is_staff'])
+
+    def test_refresh_adds_claims_to_old_tokens(self):
+        legacy = RefreshToken.for_user(get_user_model().objects.get(username='writer'))
+        self.assertNotIn('username', legacy)
+        access, refresh = self.refreshed(legacy)
+        self.assertEqual((access['username'], access['is_staff'], access['is_active']), ('writer', False, True))
+        self.assertEqual(refresh['username'], 'writer')
+
+    def test_token_user_leaves_missing_claims_deferred(self):
+        legacy = RefreshToken.for_user(get_user_model().objects.get(username='writer')).access_token
+        self.assertIn('is_active', token_user(legacy).get_deferred_fields())
+
+    def test_revocation_check_skips_the_table(self):
+        self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(denylist.is_revoked('never-issued'))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_logout_revokes_refresh_cookie(self):
+        self.client.cookies['refresh_token'] = self.refresh
+        self.client.post('/api/logout/')
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TOKEN_DENYLIST_SYNC_INTERVAL=0)
+    def test_revocations_from_other_processes_are_picked_up(self):
+        denylist.is_revoked('warm-up')
+        RevokedToken.objects.create(jti='elsewhere', expires_at=timezone.now() + timedelta(hours=1))
+        self.assertTrue(denylist.is_revoked('elsewhere'))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class AsyncReadTests(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(username='writer', password='pw')
+        make_posts(self.author, 5)
+        self.post = Post.objects.filter(published=True).first()
+        self.draft = Post.objects.create(author=self.author, title='Draft')
+
+    async def test_post_list_pages_like_the_sync_api(self):
+        response = await self.async_client.get('/api/async/posts/?page_size=3')
+        self.assertEqual(response.status_code, 200)
+        first = response.json()
+        sync = await sync_to_async(self.client.get)('/api/posts/?page_size=3')
+        self.assertEqual(first['results'], sync.json()['results'])
+
+        second = (await self.async_client.get(first['next'])).json()
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+        self.assertNotIn(self.draft.pk, [p['id'] for p in first['results'] + second['results']])
+
+    async def test_detail_comments_and_taxonomy(self):
+        post = self.post
+        response = await self.async_client.get(f'/api/async/posts/{post.pk}/')
+        self.assertEqual(response.json()['title'], post.title)
+        self.assertEqual((await self.async_client.get(f'/api/async/posts/{self.draft.pk}/')).status_code, 404)
+
+        comments = (await self.async_client.get(f'/api/async/posts/{post.pk}/comments/')).json()
+        self.assertEqual(len(comments['results']), 1)
+        self.assertEqual(comments['results'][0]['replies'], [])
+
+        self.assertEqual(len((await self.async_client.get('/api/async/tags/')).json()), 2)
+        self.assertEqual((await self.async_client.get('/api/async/posts/?cursor=junk')).status_code, 404)
+
+    async def test_drafts_visible_to_their_author_by_token(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.author).access_token))()
+        response = await self.async_client.get('/api/async/posts/', headers={'Authorization': f'Bearer {token}'})
+        self.assertIn(self.draft.pk, [p['id'] for p in response.json()['results']])
+        response = await self.async_client.get('/api/async/posts/', headers={'Authorization': 'Bearer junk'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_comments_with_a_token_lacking_the_staff_claim(self):
+        staff = await get_user_model().objects.acreate(username='mod', is_staff=True)
+        await Comment.objects.acreate(post=self.post, name='S', email='s@example.com', body='Pending')
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(staff).access_token))()
+        response = await self.async_client.get(f'/api/async/posts/{self.post.pk}/comments/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class SQLiteTuningTests(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_benchmark_runs(self):
+        out = io.StringIO()
+        call_command('dbbench', seconds=0.2, readers=2, rows=100, stdout=out)
+        self.assertIn('tuned (WAL)', out.getvalue())
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TestCase):
+    @patch('blog.routers._is_primary', return_value=False)
+    def test_router_only_sends_opted_in_reads_to_replicas(self, _):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post), 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        author = get_user_model().objects.create_user(username='writer', password='pw')
+        client = APIClient()
+        client.force_authenticate(author)
+        response = client.post('/api/posts/', {'title': 'Fresh', 'markdown': 'x'}, format='multipart')
+        self.assertEqual(response.cookies['db_pin']['max-age'], 10)
+        self.assertNotIn('db_pin', client.get('/api/tags/').cookies)
+
+
+# DJANGO_REPLICA_DB=/tmp/replica.sqlite3 python manage.py test blog
+# (the replica mirrors the test database, so the router leaves it alone
+# unless told otherwise)
+@skipUnless('replica' in settings.DATABASES, 'set DJANGO_REPLICA_DB to run against a second SQLite database')
+class ReplicaDatabaseTests(TestCase):
+    databases = {'default', *settings.REPLICA_DATABASES}
+
+    def test_mirrored_replica_reads_from_default(self):
+        with replica_reads():
+            self.assertIsNone(ReplicaRouter().db_for_read(Post))
+
+    @patch('blog.routers._is_primary', return_value=False)
+    def test_reads_hit_the_replica_until_pinned(self, _):
+        Tag.objects.create(name='primary-only')
+        client = APIClient()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual([t['name'] for t in client.get('/api/tags/').json()], ['primary-only'])
+        self.assertTrue(replica.captured_queries)
+
+        client.cookies['db_pin'] = '1'
+        cache.clear()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual([t['name'] for t in client.get('/api/tags/').json()], ['primary-only'])
+        self.assertFalse(replica.captured_queries)
+
+
+class TimedFileSystemStorage(InstrumentedStorageMixin, FileSystemStorage):
+    pass
+
+
+class InstrumentationTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.settings_override.disable()
+        storages = {'default': {'BACKEND': 'blog.tests.TimedFileSystemStorage', 'OPTIONS': {'location': self.media.name}}}
+        self.settings_override = override_settings(STORAGES=storages)
+        self.settings_override.enable()
+
+    def timings(self, response):
+        parts = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            parts[name] = dict(param.split('=', 1) for param in params)
+        return parts
+
+    def test_server_timing_counts_queries_and_storage(self):
+        make_posts(self.author, 2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/posts/')
+        timings = self.timings(response)
+        self.assertEqual(timings['db']['desc'], f'"{len(ctx.captured_queries)} queries"')
+        self.assertGreater(float(timings['ser']['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['db']['dur']))
+
+        response = self.client.post('/api/posts/', {'title': 'Pics', 'markdown': 'x', 'images': self.images(2)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(self.timings(response)['storage']['desc'], '"0 calls"')
+
+    async def test_queries_are_counted_under_asgi(self):
+        for url in ('/api/async/posts/', '/api/posts/'):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(self.timings(response)['db']['desc'], '"0 queries"', url)
+
+    @override_settings(PERF_LOG_SAMPLE_RATE=0, PERF_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('blog.perf', level='WARNING') as logs:
+            self.client.get('/api/tags/')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['path'], entry['status'], entry['slow']), ('/api/tags/', 200, True))
+
+
+class LoggingConfigTests(TestCase):
+    def test_rate_limit_drops_noisy_debug_and_reports_it(self):
+        limiter = RateLimitFilter(rate=0.001, burst=2)
+        record = lambda name, level=logging.DEBUG: logging.makeLogRecord({'name': name, 'levelno': level, 'msg': 'wire'})
+        passed = [limiter.filter(record('botocore.endpoint')) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        self.assertTrue(limiter.filter(record('botocore', logging.WARNING)))
+        self.assertTrue(limiter.filter(record('blog.views')))
+
+    def test_background_handler_writes_and_rotates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'app.log')
+            handler = BackgroundFileHandler(path, maxBytes=200, backupCount=2)
+            handler.setFormatter(logging.Formatter('%(name)s %(message)s'))
+            logger = logging.getLogger('blog.tests.background')
+            logger.addHandler(handler)
+            logger.propagate = False
+            try:
+                for i in range(20):
+                    logger.warning('line %d', i)
+                handler.flush()
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+            with open(path) as f:
+                self.assertIn('line 19', f.read())
+            self.assertTrue(os.path.exists(path + '.1'))
+
+    def test_background_handler_reopens_an_externally_rotated_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'app.log')
+            handler = BackgroundFileHandler(path)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.getLogger('blog.tests.watched')
+            logger.addHandler(handler)
+            logger.propagate = False
+            try:
+                logger.warning('before')
+                handler.flush()
+                os.rename(path, path + '.1')  # what logrotate does
+                logger.warning('after')
+                handler.flush()
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+            with open(path + '.1') as f:
+                self.assertEqual(f.read(), 'before\n')
+            with open(path) as f:
+                self.assertEqual(f.read(), 'after\n')
+
+    def test_test_runs_log_to_a_temp_dir(self):
+        filename = settings.LOGGING['handlers']['file']['filename']
+        self.assertTrue(filename.startswith(tempfile.gettempdir()), filename)
+
+    def test_profiles_build_valid_configs(self):
+        for profile in PROFILES:
+            config = build_logging('/tmp/blog-test.log', profile=profile)
+            self.assertEqual(config['handlers']['file']['filters'], ['rate_limited'])
+            self.assertEqual(config['loggers']['botocore']['level'], PROFILES[profile]['botocore'])
+
+
+@override_settings(AWS_S3_ENDPOINT_URL='https://nyc3.digitaloceanspaces.com', AWS_S3_MAX_POOL_CONNECTIONS=16)
+class SharedS3ClientTests(TestCase):
+    def setUp(self):
+        s3.reset()
+        self.addCleanup(s3.reset)
+
+    def test_one_client_across_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(pool.map(lambda _: s3.get_client(), range(16)))
+        self.assertTrue(all(client is clients[0] for client in clients))
+        self.assertEqual(clients[0].meta.config.max_pool_connections, 16)
+        self.assertEqual(clients[0].meta.config.retries['mode'], 'standard')
+
+    def test_storages_use_the_shared_client(self):
+        client = s3.get_client()
+        self.assertIs(MediaStorage().connection.meta.client, client)
+        self.assertIs(StaticStorage().connection.meta.client, client)
+        # resources are per thread, the client is not
+        self.assertIs(MediaStorage().connection, StaticStorage().connection)
+
+    def test_resources_in_other_threads_build_no_client(self):
+        s3.get_resource()
+        with patch.object(boto3.session.Session, 'client', side_effect=AssertionError('built a client')):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                resources = list(pool.map(lambda _: s3.get_resource(), range(8)))
+        self.assertTrue(all(resource.meta.client is s3.get_client() for resource in resources))
+
+    def test_reset_builds_a_new_client(self):
+        client = s3.get_client()
+        s3.reset()
+        self.assertIsNot(s3.get_client(), client)
+        self.assertIs(MediaStorage().connection.meta.client, s3.get_client())
+
+
+class CountingFileSystemStorage(FileSystemStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def url(self, name):
+        self.calls.append('url')
+        return super().url(name)
+
+    def exists(self, name):
+        self.calls.append('exists')
+        return super().exists(name)
+
+    def size(self, name):
+        self.calls.append('size')
+        return super().size(name)
+
+    def listdir(self, path):
+        self.calls.append('listdir')
+        return super().listdir(path)
+
+
+class CachedFileSystemStorage(CachedStorageMixin, CountingFileSystemStorage):
+    pass
+
+
+class MediaCacheTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.settings_override.disable()
+        storages = {'default': {'BACKEND': 'blog.tests.CachedFileSystemStorage', 'OPTIONS': {'location': self.media.name}}}
+        self.settings_override = override_settings(STORAGES=storages)
+        self.settings_override.enable()
+
+    def test_page_of_posts_makes_no_storage_calls_once_warm(self):
+        make_posts(self.author, 100)
+        Post.objects.update(featured_image='post_images/featured.jpg')
+        self.client.get('/api/posts/?page_size=100')
+        cache.clear()  # the response cache would hide the storage entirely
+        default_storage.calls.clear()
+
+        response = self.client.get('/api/posts/?page_size=100')
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertEqual(default_storage.calls, [])
+
+    def test_only_positive_metadata_is_cached(self):
+        name = default_storage.save('post_images/a.jpg', SimpleUploadedFile('a.jpg', b'12345'))
+        self.assertEqual(default_storage.size(name), 5)
+        default_storage.calls.clear()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(default_storage.size(name), 5)
+        self.assertFalse(default_storage.exists('post_images/missing.jpg'))
+        self.assertFalse(default_storage.exists('post_images/missing.jpg'))
+        self.assertEqual(default_storage.calls, ['exists', 'exists'])
+
+        default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_bulk_upload_checks_existence_with_one_listing(self):
+        # written behind the storage's back, so only the listing knows
+        os.makedirs(os.path.join(self.media.name, 'post_images'))
+        with open(os.path.join(self.media.name, 'post_images', 'photo0.jpg'), 'wb') as f:
+            f.write(b'old')
+
+        response = self.client.post('/api/posts/', {'title': 'Gallery', 'markdown': 'x', 'images': self.images(5)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(default_storage.calls.count('listdir'), 1)
+        self.assertNotIn('exists', default_storage.calls)
+        # the taken name still got a fresh one
+        self.assertEqual(len(self.stored_files()), 6)
+        self.assertEqual(PostImage.objects.filter(image='post_images/photo0.jpg').count(), 0)
+
+    @patch('blog.mediacache.LIST_LIMIT', 3)
+    def test_crowded_prefixes_are_probed_not_trusted(self):
+        response = self.client.post('/api/posts/', {'title': 'Gallery', 'markdown': 'x', 'images': self.images(5)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        default_storage.calls.clear()
+
+        response = self.client.post('/api/posts/', {'title': 'Again', 'markdown': 'x', 'images': self.images(5)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.stored_files()), 10)
+        self.assertIn('exists', default_storage.calls)
+
+    def test_unrelated_names_are_probed_not_listed(self):
+        files = [SimpleUploadedFile(name, b'jpeg-bytes', content_type='image/jpeg') for name in ('cat.jpg', 'dog.jpg')]
+        response = self.client.post('/api/posts/', {'title': 'Pets', 'markdown': 'x', 'images': files}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('listdir', default_storage.calls)
+        self.assertEqual(default_storage.calls.count('exists'), 2)
+
+    def test_ttl_cache_expires_and_evicts(self):
+        lru = TTLCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        lru.set('d', 4, ttl=0)
+        self.assertIsNone(lru.get('d'))
+
+
+class SyncMediaTests(TestCase):
+    def setUp(self):
+        self.source = tempfile.TemporaryDirectory()
+        self.dest = tempfile.TemporaryDirectory()
+        self.addCleanup(self.source.cleanup)
+        self.addCleanup(self.dest.cleanup)
+        self.files = {
+            'post_images/featured.jpg': b'featured',
+            'post_images/derivatives/featured__320w.webp': b'small',
+            'post_images/big.jpg': os.urandom(3 * 1024 * 1024 + 17),
+            'profile_images/me.png': b'me',
+        }
+        for name, content in self.files.items():
+            self.write(self.source.name, name, content)
+
+        author = get_user_model().objects.create_user(username='writer', password='pw', profile_image='profile_images/me.png')
+        post = Post.objects.create(
+            author=author, title='Media', markdown='x', featured_image='post_images/featured.jpg',
+            featured_image_variants={'source': 'post_images/featured.jpg', 'webp': [{'width': 320, 'height': 200, 'name': 'post_images/derivatives/featured__320w.webp'}]},
+        )
+        PostImage.objects.create(post=post, image='post_images/big.jpg')
+        PostImage.objects.create(post=post, image='post_images/gone.jpg')
+
+    def write(self, root, name, content):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def read(self, root, name):
+        with open(os.path.join(root, name), 'rb') as f:
+            return f.read()
+
+    def syncmedia(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('syncmedia', '--from', self.source.name, '--to', self.dest.name, '--chunk-size', '1', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_copies_then_skips_unchanged(self):
+        out, err = self.syncmedia('--workers', '3')
+        self.assertIn('4 copied', out)
+        self.assertIn('1 missing', out)
+        self.assertIn('post_images/gone.jpg', err)
+        for name, content in self.files.items():
+            self.assertEqual(self.read(self.dest.name, name), content)
+
+        # same size, different bytes: only the checksum can tell
+        self.write(self.source.name, 'post_images/featured.jpg', b'FEATURED')
+        out, _ = self.syncmedia()
+        self.assertIn('1 copied', out)
+        self.assertIn('3 unchanged', out)
+        self.assertEqual(self.read(self.dest.name, 'post_images/featured.jpg'), b'FEATURED')
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dest.name, 'post_images'))), ['big.jpg', 'derivatives', 'featured.jpg'])
+
+    def test_resumes_from_checkpoint(self):
+        checkpoint = os.path.join(self.dest.name, 'sync.ckpt')
+        with open(checkpoint, 'w') as f:
+            f.write('post_images/big.jpg\nprofile_images/me.png\n')
+
+        out, _ = self.syncmedia('--checkpoint', checkpoint)
+        self.assertIn('Resuming: 2 of 5', out)
+        self.assertIn('2 copied', out)
+        self.assertFalse(os.path.exists(os.path.join(self.dest.name, 'post_images/big.jpg')))
+        self.assertFalse(os.path.exists(checkpoint))  # clean run: nothing left to resume
+
+    def test_failures_keep_the_checkpoint(self):
+        checkpoint = os.path.join(self.dest.name, 'sync.ckpt')
+        real_copy = MediaSync.copy
+
+        def flaky(sync, name):
+            if name == 'post_images/big.jpg':
+                raise OSError('connection reset')
+            return real_copy(sync, name)
+
+        with patch.object(MediaSync, 'copy', flaky):
+            with self.assertRaisesMessage(CommandError, '1 failed'):
+                self.syncmedia('--checkpoint', checkpoint)
+        with open(checkpoint) as f:
+            self.assertEqual(len(f.read().split()), 3)
+
+        out, _ = self.syncmedia('--checkpoint', checkpoint)
+        self.assertIn('1 copied', out)
+        self.assertEqual(self.read(self.dest.name, 'post_images/big.jpg'), self.files['post_images/big.jpg'])
+
+    def test_interrupted_run_keeps_the_checkpoint(self):
+        checkpoint = os.path.join(self.dest.name, 'sync.ckpt')
+        real_sync = MediaSync.sync
+
+        def interrupted(sync, name):
+            if name == 'post_images/big.jpg':
+                raise KeyboardInterrupt
+            return real_sync(sync, name)
+
+        with patch.object(MediaSync, 'sync', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.syncmedia('--checkpoint', checkpoint, '--workers', '1')
+        with open(checkpoint) as f:
+            self.assertIn('post_images/featured.jpg', f.read().split())
+
+        out, _ = self.syncmedia('--checkpoint', checkpoint)
+        self.assertIn('Resuming:', out)
+        self.assertFalse(os.path.exists(checkpoint))
@@ -0,0 +1,35 @@
+from django.conf import settings
+
+
+def reply_depth(request):
+    """
+    Reply levels to return under each top-level comment: `?depth=`, capped
+    by COMMENT_MAX_DEPTH.
+    """
+    limit = settings.COMMENT_MAX_DEPTH - 1
+    try:
+        return max(0, min(int(request.query_params.get('depth', limit)), limit))
+    except ValueError:
+        return limit
+
+
+def build_tree(comments, data):
+    """
+    Nest serialized comments under their parents in one pass.
+
+    `comments` must list every parent before its replies (top-level page
+    first, then replies ordered by path); `data` is their serialized form in
+    the same order. Replies whose parent isn't there (unapproved, or cut off
+    by the depth limit) are dropped along with their subtree.
+    """
+    nodes, roots = {}, []
+    for comment, node in zip(comments, data):
+        node['replies'] = []
+        if comment.parent_id is None:
+            roots.append(node)
+        elif comment.parent_id in nodes:
+            nodes[comment.parent_id]['replies'].append(node)
+        else:
+            continue
+        nodes[comment.pk] = node
+    return roots
@@ -0,0 +1,263 @@
+import logging
+import mimetypes
+import posixpath
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import copy_context
+from datetime import timedelta
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import adjust_post
+from .derivatives import schedule as schedule_derivatives
+from .instrumentation import storage_call
+from .mediacache import existence_batch
+from .models import PendingImageUpload, Post, PostImage
+from .signals import touch_posts
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGES_PER_POST = 10
+
+
+class UploadRejected(Exception):
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _upload_pool():
+    """
+    The process-wide upload pool, so its threads (and the S3 resources they
+    hold) outlive the request. IMAGE_UPLOAD_WORKERS bounds all concurrent
+    uploads in the process, not each request's.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.IMAGE_UPLOAD_WORKERS, thread_name_prefix='image-upload')
+    return _pool
+
+
+def _image_field():
+    return PostImage._meta.get_field('image')
+
+
+def _upload(name, file):
+    field = _image_field()
+    # Storage.save() streams from the file object (a spooled temp file for
+    # large uploads); S3Boto3Storage hands it to upload_fileobj in chunks.
+    return field.storage.save(name, file, max_length=field.max_length)
+
+
+def _target_names(files):
+    """
+    Storage names for `files`, distinct within the batch. They're saved
+    concurrently, so two `photo.jpg` would otherwise both resolve to the same
+    key and only the last upload would survive.
+    """
+    field = _image_field()
+    names, taken = [], set()
+    for file in files:
+        name = field.generate_filename(PostImage(), file.name)
+        while name in taken:
+            name = field.storage.get_alternative_name(*posixpath.splitext(name))
+        taken.add(name)
+        names.append(name)
+    return names
+
+
+def discard_images(names):
+    storage = _image_field().storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception('Could not clean up uploaded image %s', name)
+
+
+def upload_images(files):
+    """
+    Push `files` to the PostImage storage concurrently through a bounded pool
+    and return the stored names in input order. If any upload fails the ones
+    that made it are deleted and the first error is re-raised.
+    """
+    if not files:
+        return []
+
+    field = _image_field()
+    wanted = _target_names(files)
+    pool = _upload_pool()
+    # one listing instead of an exists() round trip per file (AWS_S3_FILE_OVERWRITE is off)
+    with existence_batch(field.storage, wanted):
+        # copy_context: storage timings (blog.instrumentation) and the batch carry over
+        futures = [pool.submit(copy_context().run, _upload, name, file) for name, file in zip(wanted, files)]
+        wait(futures)
+
+    names, errors = [], []
+    for future in futures:
+        if future.exception() is None:
+            names.append(future.result())
+        else:
+            errors.append(future.exception())
+
+    if errors:
+        discard_images(names)
+        raise errors[0]
+    return names
+
+
+@contextmanager
+def uploaded_images(files):
+    """
+    Upload `files` before the block runs; if the block raises (e.g. the post
+    transaction rolls back) the uploaded objects are deleted again.
+    """
+    names = upload_images(files)
+    try:
+        yield names
+    except BaseException:
+        discard_images(names)
+        raise
+
+
+def attach_images(post, names):
+    """
+    Create the PostImage rows for already-uploaded names in one INSERT.
+    """
+    if not names:
+        return []
+    images = PostImage.objects.bulk_create([PostImage(post=post, image=name) for name in names])
+    # bulk_create skips post_save
+    touch_posts(pk=post.pk)
+    adjust_post(post.pk, image_count=len(images))
+    for image in images:
+        schedule_derivatives(image, 'image', 'variants')
+    return images
+
+
+def presigned_post(name, content_type):
+    """
+    Presigned POST for uploading `name` straight to the bucket. The policy pins
+    the key, the content type and the allowed size range.
+    """
+    storage = _image_field().storage
+    if not hasattr(storage, 'bucket_name'):
+        raise UploadRejected('Direct uploads need an S3-compatible media storage.')
+    key = storage._normalize_name(name)
+    client = storage.connection.meta.client
+    fields = {'Content-Type': content_type}
+    conditions = [
+        {'Content-Type': content_type},
+        ['content-length-range', 1, settings.IMAGE_UPLOAD_MAX_SIZE],
+    ]
+    if storage.default_acl:
+        fields['acl'] = storage.default_acl
+        conditions.append({'acl': storage.default_acl})
+    return client.generate_presigned_post(
+        storage.bucket_name, key, Fields=fields, Conditions=conditions,
+        ExpiresIn=settings.IMAGE_UPLOAD_URL_EXPIRY,
+    )
+
+
+def used_image_slots(post):
+    active = post.pending_uploads.filter(expires_at__gt=timezone.now(), image__isnull=True)
+    return post.image_count + active.count()
+
+
+def _expire(uploads):
+    """
+    Delete expired, never finalized reservations and whatever the clients
+    managed to put in the bucket for them (once the rows are gone).
+    """
+    uploads = uploads.filter(image__isnull=True)
+    names = list(uploads.values_list('name', flat=True))
+    uploads.delete()
+    if names:
+        transaction.on_commit(lambda: discard_images(names))
+
+
+def reserve_upload(post, filename, content_type):
+    """
+    Take one of the post's image slots and issue a presigned upload for it.
+    The post row is locked while slots are counted, so concurrent issuers
+    can't go over MAX_IMAGES_PER_POST between them.
+    """
+    if content_type not in settings.IMAGE_UPLOAD_CONTENT_TYPES:
+        raise UploadRejected(f'Unsupported content type: {content_type}')
+
+    extension = posixpath.splitext(filename)[1].lower() or mimetypes.guess_extension(content_type) or ''
+    name = _image_field().generate_filename(PostImage(), f'{uuid.uuid4().hex}{extension}')
+    now = timezone.now()
+
+    with transaction.atomic():
+        post = Post.objects.select_for_update().get(pk=post.pk)
+        _expire(post.pending_uploads.filter(expires_at__lte=now))
+        if used_image_slots(post) >= MAX_IMAGES_PER_POST:
+            raise UploadRejected(f'Maximum of {MAX_IMAGES_PER_POST} images per post allowed.')
+        upload = PendingImageUpload.objects.create(
+            post=post, name=name, content_type=content_type,
+            expires_at=now + timedelta(seconds=settings.IMAGE_UPLOAD_URL_EXPIRY),
+        )
+    return upload, presigned_post(name, content_type)
+
+
+def _stored_object(storage, name):
+    """
+    (size, content type) of a stored object, or None if it isn't there.
+    One HEAD on S3.
+    """
+    if hasattr(storage, 'bucket'):
+        obj = storage.bucket.Object(storage._normalize_name(name))
+        try:
+            with storage_call():
+                obj.load()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return obj.content_length, obj.content_type
+    if not storage.exists(name):
+        return None
+    return storage.size(name), mimetypes.guess_type(name)[0]
+
+
+def finalize_upload(upload):
+    """
+    Check the object the client uploaded for `upload` and turn it into a
+    PostImage. Rejected objects are deleted and the slot released.
+    Finalizing the same upload again (a retry, or two requests racing)
+    returns the same PostImage.
+    """
+    if upload.image_id:
+        return upload.image
+    storage = _image_field().storage
+    if upload.expires_at <= timezone.now():
+        _expire(PendingImageUpload.objects.filter(pk=upload.pk))
+        raise UploadRejected('Upload expired.')
+    stored = _stored_object(storage, upload.name)
+    if stored is None:
+        raise UploadRejected('Uploaded object not found.')
+
+    size, content_type = stored
+    if size > settings.IMAGE_UPLOAD_MAX_SIZE or content_type != upload.content_type:
+        discard_images([upload.name])
+        upload.delete()
+        raise UploadRejected('Uploaded object does not match the issued upload.')
+
+    with transaction.atomic():
+        upload = PendingImageUpload.objects.select_for_update().select_related('image').filter(pk=upload.pk).first()
+        if upload is None:
+            raise UploadRejected('Upload is no longer pending.')
+        if upload.image is None:
+            upload.image = PostImage.objects.create(post_id=upload.post_id, image=upload.name)
+            upload.save(update_fields=['image'])
+    return upload.image
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested.routers import NestedDefaultRouter
+from . import async_views
 from .views import test_upload_to_spaces, test_s3_credentials, CookieLoginView, PostViewSet, PostImageViewSet, PostCreateAPIView, PostUpdateAPIView, PostDetailAPIView, CategoryViewSet, TagViewSet, CommentViewSet, me, logout
 
 router = DefaultRouter()
@@ -26,4 +27,11 @@ urlpatterns += [
     path('post/<int:pk>/update/', PostUpdateAPIView.as_view()),
     path('test-s3-auth/', test_s3_credentials),
     path('test-upload/', test_upload_to_spaces),
+
+    # async read path (blog/async_views.py), for ASGI deployments
+    path('async/posts/', async_views.post_list),
+    path('async/posts/<int:pk>/', async_views.post_detail),
+    path('async/posts/<int:post_pk>/comments/', async_views.comment_list),
+    path('async/categories/', async_views.category_list),
+    path('async/tags/', async_views.tag_list),
 ]
\ No newline at end of file
@@ -1,34 +1,52 @@
+import asyncio
 import datetime
-import boto3
+from asgiref.sync import sync_to_async
 
 from botocore.exceptions import NoCredentialsError, ClientError
 from django.shortcuts import render, get_object_or_404
 from django.conf import settings
+from django.db import transaction
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.http import JsonResponse
 from rest_framework import generics, viewsets, permissions, serializers, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.views import APIView
 
-from .models import Post, PostImage, Category, Tag, Comment
+from .auth import DenylistRefreshToken
+from .cache import CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .filters import PostFilterBackend, visible_posts
+from .moderation import approve_comments, reject_comments
+from .models import Post, PostImage, PendingImageUpload, Category, Tag, Comment
 from .permissions import IsAuthorOrReadOnly
-from .serializers import PostSerializer, PostImageSerializer, CategorySerializer, TagSerializer, CommentSerializer
-
-
-def test_upload_to_spaces(request):
+from .pagination import CreatedAtCursorPagination, CommentCursorPagination, PostImageCursorPagination
+from .queries import QueryPlanMixin
+from .routers import ReplicaReadMixin
+from .s3 import get_client
+from .search import get_search_backend
+from .serializers import PostSerializer, PostListSerializer, PostImageSerializer, CategorySerializer, TagSerializer, CommentSerializer, CommentModerationSerializer, ImageUploadRequestSerializer, ImageUploadFinalizeSerializer
+from .tags import resolve_tags
+from .threads import build_tree, reply_depth
+from .uploads import MAX_IMAGES_PER_POST, UploadRejected, attach_images, finalize_upload, reserve_upload, uploaded_images, used_image_slots
+
+
+async def test_upload_to_spaces(request):
     now = datetime.datetime.utcnow().isoformat()
     filename = f"test_upload_{now}.txt"
     content = ContentFile(b"This is a test upload to DigitalOcean Spaces.")
     
     try:
-        file_path = default_storage.save(filename, content)
+        # storage calls block on the network, keep them off the event loop
+        file_path = await sync_to_async(default_storage.save, thread_sensitive=False)(filename, content)
         file_url = default_storage.url(file_path)
         return JsonResponse({
             "success": True,
@@ -41,27 +59,25 @@ def test_upload_to_spaces(request):
             "error": str(e)
         })
     
-def test_s3_credentials(request):
+async def test_s3_credentials(request):
+    in_thread = lambda func: sync_to_async(func, thread_sensitive=False)
     try:
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-        )
-
-        # List first 5 objects in bucket
-        objects = s3.list_objects_v2(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-            MaxKeys=5
-        )
+        # first call builds the shared client, so keep it off the event loop too
+        s3 = await in_thread(get_client)()
 
-        # Upload a small test object
+        # List first 5 objects in bucket and upload a small test object,
+        # both at once (boto3 clients are thread-safe)
         test_key = 'test_s3_credentials.txt'
-        s3.put_object(
-            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-            Key=test_key,
-            Body=b"This is a test file from Django"
+        objects, _ = await asyncio.gather(
+            in_thread(s3.list_objects_v2)(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                MaxKeys=5
+            ),
+            in_thread(s3.put_object)(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=test_key,
+                Body=b"This is a test file from Django"
+            ),
         )
 
         # # (Optional) Delete test object
@@ -133,32 +149,90 @@ def me(request):
 
 @api_view(['POST'])
 def logout(request):
+    # revoke the refresh token too, otherwise it stays good for a day
+    raw_refresh = request.COOKIES.get('refresh_token') or request.data.get('refresh')
+    if raw_refresh:
+        try:
+            DenylistRefreshToken(raw_refresh).revoke()
+        except TokenError:
+            pass  # already expired or revoked
     response = Response({'message': 'Logged out successfully'}, status=200)
     response.delete_cookie('access_token', path='/')
     response.delete_cookie('refresh_token', path='/')
     return response
     
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all().order_by('-created_at')
     serializer_class = PostSerializer
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [PostFilterBackend, OrderingFilter]
+    ordering_fields = ['created_at', 'updated_at', 'title']
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]  # 🔐 Only logged-in users with a valid JWT can post but anyone can read. Also, only the author of a post can edit/delete their posts.
 
-    def perform_create(self, serializer):
-        post = serializer.save(author=self.request.user)
+    def get_serializer_class(self):
+        if self.action in ('list', 'search'):
+            return PostListSerializer
+        return super().get_serializer_class()
 
-        # handle tags
-        tags = self.request.data.getlist('tags', [])
-        for tag_name in tags:
-            tag, _ = Tag.objects.get_or_create(name=tag_name.strip())
-            post.tags.add(tag)
+    def get_cache_tags(self):
+        if self.action == 'list':
+            return ['posts', 'tags', 'categories']
+        return [f"post:{self.kwargs['pk']}", 'tags', 'categories']
+
+    def get_queryset(self):
+        queryset = visible_posts(super().get_queryset(), self.request.user)
+        if self.action in ('list', 'search'):
+            # listings only need the stored excerpt, not the bodies
+            queryset = queryset.defer('markdown', 'rendered_html', 'toc')
+        return queryset
 
-        # handle images
+    def perform_create(self, serializer):
         images = self.request.FILES.getlist('images')
         if len(images) > 10:
             raise serializers.ValidationError("Maximum of 10 images allowed.")
-        for image in images:
-            PostImage.objects.create(post=post, image=image)
+
+        # upload the images first (in parallel, outside the transaction),
+        # they get deleted again if the post can't be saved
+        with uploaded_images(images) as image_names, transaction.atomic():
+            post = serializer.save(author=self.request.user)
+
+            # handle tags
+            tags = resolve_tags(self.request.data.getlist('tags', []))
+            if tags:
+                post.tags.add(*tags)
+
+            attach_images(post, image_names)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search over published posts: ?q=<terms>&limit=&offset=
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'The "q" parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        backend = get_search_backend()
+        if backend is None:
+            return Response({'detail': 'Search is not available on this database.'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({'detail': 'limit and offset must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = backend.search(query, limit=limit, offset=offset)
+        posts = self.get_queryset().in_bulk([hit.post_id for hit in hits])
+        results = []
+        for hit in hits:
+            if hit.post_id not in posts:
+                continue
+            data = self.get_serializer(posts[hit.post_id]).data
+            data['rank'] = hit.rank
+            data['snippet'] = hit.snippet
+            results.append(data)
+        return Response({'query': query, 'results': results})
 
     def perform_destroy(self, instance):
         if instance.author != self.request.user:
@@ -168,6 +242,15 @@ class PostViewSet(viewsets.ModelViewSet):
 class PostImageViewSet(viewsets.ModelViewSet):
     queryset = PostImage.objects.all()
     serializer_class = PostImageSerializer
+    pagination_class = PostImageCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # nested /posts/<post_pk>/images/ only lists that post's images
+        post_id = self.kwargs.get('post_pk')
+        if post_id is not None:
+            queryset = queryset.filter(post__id=post_id)
+        return queryset
 
     def create(self, request, *args, **kwargs):
         post_id = request.data.get('post')
@@ -179,16 +262,64 @@ class PostImageViewSet(viewsets.ModelViewSet):
         except Post.DoesNotExist:
             return Response({'detail': 'Post not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        if post.images.count() >= 10:
+        if used_image_slots(post) >= MAX_IMAGES_PER_POST:
             return Response({'detail': 'Maximum of 10 images per post allowed.'}, status=status.HTTP_400_BAD_REQUEST)
 
         return super().create(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def presign(self, request):
+        """
+        Issue a presigned POST so the client uploads straight to the bucket.
+        """
+        serializer = ImageUploadRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        post = serializer.validated_data['post']
+        if post.author != request.user:
+            raise PermissionDenied("You can only add images to your own posts.")
+
+        try:
+            upload, presigned = reserve_upload(post, serializer.validated_data['filename'], serializer.validated_data['content_type'])
+        except UploadRejected as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'upload_id': upload.pk,
+            'name': upload.name,
+            'url': presigned['url'],
+            'fields': presigned['fields'],
+            'expires_at': upload.expires_at,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def finalize(self, request):
+        """
+        Verify a presigned upload landed and create its PostImage.
+        """
+        serializer = ImageUploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = get_object_or_404(PendingImageUpload.objects.select_related('post', 'image'), pk=serializer.validated_data['upload_id'])
+        if upload.post.author != request.user:
+            raise PermissionDenied("You can only add images to your own posts.")
+
+        try:
+            image = finalize_upload(upload)
+        except UploadRejected as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class PostDetailAPIView(generics.RetrieveAPIView):
+        return Response(PostImageSerializer(image, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
+
+
+class PostDetailAPIView(ConditionalGetMixin, CachedResponseMixin, QueryPlanMixin, generics.RetrieveAPIView):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
+    def get_queryset(self):
+        return visible_posts(super().get_queryset(), self.request.user)
+
+    def get_cache_tags(self):
+        return [f"post:{self.kwargs['pk']}", 'tags', 'categories']
+
 class PostCreateAPIView(generics.CreateAPIView):
     model = Post
     serializer_class = PostSerializer
@@ -197,21 +328,20 @@ class PostCreateAPIView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         print("user: ", self.request.user)
-        post = serializer.save(author=self.request.user)
-
-        # Attach tags
-        tags_raw = self.request.data.getlist('tags')  # expect multiple "tags=AI" form fields
-        for tag_name in tags_raw:
-            tag, _ = Tag.objects.get_or_create(name=tag_name.strip())
-            post.tags.add(tag)
-
-        # Attach images
         images = self.request.FILES.getlist('images')
         if len(images) > 10:
             raise ValueError("You can only upload up to 10 images.")
-        
-        for image in images:
-            PostImage.objects.create(post=post, image=image)
+
+        with uploaded_images(images) as image_names, transaction.atomic():
+            post = serializer.save(author=self.request.user)
+
+            # Attach tags
+            tags = resolve_tags(self.request.data.getlist('tags'))  # expect multiple "tags=AI" form fields
+            if tags:
+                post.tags.add(*tags)
+
+            # Attach images
+            attach_images(post, image_names)
 
     def create(self, request, *args, **kwargs):
         print(request.method)
@@ -221,7 +351,7 @@ class PostCreateAPIView(generics.CreateAPIView):
         return super().create(request, *args, **kwargs)
     
 
-class PostUpdateAPIView(generics.RetrieveUpdateAPIView):
+class PostUpdateAPIView(QueryPlanMixin, generics.RetrieveUpdateAPIView):
     queryset = Post.objects.all()
     parser_classes = [MultiPartParser, FormParser]
     serializer_class = PostSerializer
@@ -229,13 +359,15 @@ class PostUpdateAPIView(generics.RetrieveUpdateAPIView):
 
     def patch(self, request, pk):
         try:
-            post = Post.objects.get(pk=pk)
+            post = self.get_queryset().get(pk=pk)
         except Post.DoesNotExist:
             return Response({"error": "Not found"}, status=404)
 
         serializer = PostSerializer(post, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
             serializer.save()
+            # drop the prefetched relations so the response reflects the update
+            post._prefetched_objects_cache = {}
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
@@ -272,24 +404,78 @@ class PostUpdateAPIView(generics.RetrieveUpdateAPIView):
     # #             PostImage.objects.create(post=updated_post, image=image)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
-class TagViewSet(viewsets.ModelViewSet):
+    def get_cache_tags(self):
+        return ['categories']
+
+class TagViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
-class CommentViewSet(viewsets.ModelViewSet):
+    def get_cache_tags(self):
+        return ['tags']
+
+class CommentViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    pagination_class = CommentCursorPagination
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
     def get_queryset(self):
         post_id = self.kwargs.get('post_pk')
-        return Comment.objects.filter(post__id=post_id)
+        queryset = Comment.objects.filter(post__id=post_id)
+        # unapproved comments are only for the moderators
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(approved=True)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Nested under a post: a cursor page of top-level comments, each with
+        its replies as a tree down to `?depth=` levels.
+        """
+        if 'post_pk' not in self.kwargs:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.filter(parent__isnull=True))
+        replies = []
+        depth = reply_depth(request)
+        if page and depth:
+            # whole threads in one query; path order puts parents first
+            replies = queryset.filter(thread__in=[c.pk for c in page], depth__range=(1, depth)).order_by('path')
+        comments = [*page, *replies]
+        data = build_tree(comments, self.get_serializer(comments, many=True).data)
+        return self.get_paginated_response(data)
 
     def perform_create(self, serializer):
         post_id = self.kwargs.get('post_pk')
         post = get_object_or_404(Post, id=post_id)
-        serializer.save(author=self.request.user, post=post)
\ No newline at end of file
+        parent = serializer.validated_data.get('parent')
+        if parent is not None and (parent.post_id != post.id or not parent.approved):
+            raise serializers.ValidationError({'parent': 'Can only reply to approved comments on this post.'})
+        serializer.save(post=post)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def moderation(self, request, *args, **kwargs):
+        """
+        Staff queue of comments awaiting approval, oldest first.
+        """
+        page = self.paginate_queryset(Comment.objects.filter(approved=False))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def approve(self, request, *args, **kwargs):
+        serializer = CommentModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'approved': approve_comments(serializer.validated_data['ids'])})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def reject(self, request, *args, **kwargs):
+        serializer = CommentModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'rejected': reject_comments(serializer.validated_data['ids'])})
\ No newline at end of file
@@ -1,8 +1,9 @@
 import os
-import boto3
 import logging
 from dotenv import load_dotenv
 
+from blog.s3 import make_client
+
 # Load variables from .env file
 load_dotenv()
 
@@ -24,13 +25,13 @@ console = logging.StreamHandler()
 console.setLevel(logging.DEBUG)
 logging.getLogger().addHandler(console)
 
-# Create an S3 client (DigitalOcean Spaces-compatible)
-s3 = boto3.client(
-    "s3",
+# Create an S3 client (DigitalOcean Spaces-compatible), with the same
+# pool/retry/timeout tuning the app uses (blog/s3.py)
+s3 = make_client(
     region_name="nyc3",
     endpoint_url="https://codetitan.nyc3.digitaloceanspaces.com",
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+    access_key=os.getenv('AWS_ACCESS_KEY_ID'),
+    secret_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
 )
 
 # Make a simple API call to trigger logging